@@ -0,0 +1,241 @@
+import math
+import os
+from dataclasses import dataclass
+from typing import Callable, List, NamedTuple, Optional, Tuple
+
+from rich import print
+from rich.console import Group
+from rich.progress import Progress, SpinnerColumn, TextColumn, TimeElapsedColumn
+from rich.table import Table
+
+from atcdr.stress import check_compiled
+from atcdr.test import (
+    DEFAULT_TIME_LIMIT,
+    KILL_DEADLINE_FACTOR,
+    PreparedProgram,
+    prepare_program,
+)
+from atcdr.util.process import run_process
+from atcdr.util.testcase_cache import TestCaseCache, find_problem_html
+
+# 入力の生成は計測しないので, 制限時間をこの倍率まで緩める
+GENERATOR_TIME_LIMIT_FACTOR = 10
+
+
+class ComplexityModel(NamedTuple):
+    name: str
+    func: Callable[[float], float]
+
+
+COMPLEXITY_MODELS: List[ComplexityModel] = [
+    ComplexityModel('O(log n)', lambda n: math.log2(n)),
+    ComplexityModel('O(√n)', lambda n: math.sqrt(n)),
+    ComplexityModel('O(n)', lambda n: n),
+    ComplexityModel('O(n log n)', lambda n: n * math.log2(n)),
+    ComplexityModel('O(n log² n)', lambda n: n * math.log2(n) ** 2),
+    ComplexityModel('O(n√n)', lambda n: n * math.sqrt(n)),
+    ComplexityModel('O(n²)', lambda n: n**2),
+    ComplexityModel('O(n² log n)', lambda n: n**2 * math.log2(n)),
+    ComplexityModel('O(n³)', lambda n: n**3),
+]
+
+
+class Sample(NamedTuple):
+    n: int
+    time_ns: int
+
+
+@dataclass
+class ModelFit:
+    model: ComplexityModel
+    constant_ns: float  # 起動時間などnに依らない部分
+    coefficient_ns: float
+    error: float  # 相対誤差の二乗平均平方根
+
+    def predict_ns(self, n: int) -> float:
+        return self.constant_ns + self.coefficient_ns * self.model.func(max(n, 2))
+
+
+def fit_model(model: ComplexityModel, samples: List[Sample]) -> ModelFit:
+    """t = a + c·f(n) を相対誤差の二乗和が最小になるように当てはめる (a, c ≥ 0)."""
+    # 相対誤差で測るために, 各点を実測値で割った重み付き最小二乗法を解く
+    rows = [(1 / s.time_ns, model.func(max(s.n, 2)) / s.time_ns) for s in samples]
+
+    def error(a: float, c: float) -> float:
+        residuals = [a * x + c * y - 1 for x, y in rows]
+        return math.sqrt(sum(r * r for r in residuals) / len(residuals))
+
+    sxx = sum(x * x for x, _ in rows)
+    sxy = sum(x * y for x, y in rows)
+    syy = sum(y * y for _, y in rows)
+    sx = sum(x for x, _ in rows)
+    sy = sum(y for _, y in rows)
+
+    candidates: List[Tuple[float, float]] = [(sx / sxx, 0.0), (0.0, sy / syy)]
+    det = sxx * syy - sxy * sxy
+    if det > 0:
+        a = (sx * syy - sy * sxy) / det
+        c = (sy * sxx - sx * sxy) / det
+        if a >= 0 and c >= 0:
+            candidates.append((a, c))
+    a, c = min(candidates, key=lambda ac: error(*ac))
+    return ModelFit(model, a, c, error(a, c))
+
+
+def fit_models(samples: List[Sample]) -> List[ModelFit]:
+    """すべてのモデルを当てはめ, よく合う順に並べる.
+
+    nに依存しない (係数が0になった) 当てはめは, どのモデルでも同じなので除く.
+    """
+    fits = [fit_model(model, samples) for model in COMPLEXITY_MODELS]
+    fits = [fit for fit in fits if fit.coefficient_ns > 0] or fits[:1]
+    return sorted(fits, key=lambda fit: fit.error)
+
+
+def input_sizes(max_n: int, steps: int) -> List[int]:
+    """max_nから半分ずつ小さくした入力サイズを小さい順に返す."""
+    sizes = {max(1, max_n >> k) for k in range(steps)}
+    return sorted(sizes)
+
+
+class ComplexityEstimator:
+    """ジェネレーターで入力サイズを変えながら解答を実行し, 実行時間を集める.
+
+    ジェネレーターは `gen SEED N` の形で呼び出す. 実行時間は計測用のラッパーで
+    ナノ秒単位で測り, 同じサイズを繰り返したうちの最小値を使う.
+    """
+
+    def __init__(
+        self,
+        generator: PreparedProgram,
+        solution: PreparedProgram,
+        time_limit: int = DEFAULT_TIME_LIMIT,
+        repeat: int = 3,
+    ) -> None:
+        self.generator = generator
+        self.solution = solution
+        self.time_limit = time_limit
+        self.repeat = repeat
+
+    def measure(self, n: int, seed: int) -> Tuple[Optional[int], str]:
+        gen = run_process(
+            self.generator.cmd + [str(seed), str(n)],
+            b'',
+            self.time_limit * GENERATOR_TIME_LIMIT_FACTOR / 1000,
+            measure=False,
+        )
+        if gen.returncode != 0 or gen.timed_out:
+            return None, 'ジェネレーターの実行に失敗しました'
+
+        times = []
+        for _ in range(self.repeat):
+            result = run_process(
+                self.solution.cmd,
+                gen.stdout,
+                self.time_limit * KILL_DEADLINE_FACTOR / 1000,
+            )
+            if result.timed_out:
+                return None, '実行時間制限を大きく超えたので打ち切りました'
+            if result.returncode != 0:
+                return None, f'解答が終了コード{result.returncode}で終了しました'
+            times.append(result.wall_time_ns)
+        return min(times), ''
+
+    def run(
+        self, sizes: List[int], seed: int, progress: Progress
+    ) -> Tuple[List[Sample], str]:
+        task_id = progress.add_task('計測中', total=len(sizes))
+        samples: List[Sample] = []
+        message = ''
+        for n in sizes:
+            progress.update(task_id, description=f'計測中 n={n}')
+            time_ns, message = self.measure(n, seed)
+            if time_ns is None:
+                break
+            samples.append(Sample(n, time_ns))
+            progress.advance(task_id)
+            # 制限時間を超えたら, それより大きい入力は計測しなくても見積もれる
+            if time_ns > self.time_limit * 1_000_000:
+                break
+        progress.update(task_id, description='計測完了')
+        return samples, message
+
+
+def create_renderable_complexity(
+    samples: List[Sample], fits: List[ModelFit], max_n: int, time_limit: int
+) -> Group:
+    measured = Table(title='実行時間', title_justify='left')
+    measured.add_column('n', justify='right')
+    measured.add_column('実行時間', justify='right')
+    for sample in samples:
+        measured.add_row(f'{sample.n:,}', f'{sample.time_ns / 1e6:.3f} ms')
+
+    estimated = Table(title='計算量の推定', title_justify='left')
+    estimated.add_column('モデル')
+    estimated.add_column('誤差', justify='right')
+    estimated.add_column(f'n={max_n:,} での予測', justify='right')
+    for i, fit in enumerate(fits):
+        predicted_ms = fit.predict_ns(max_n) / 1e6
+        color = 'green' if predicted_ms <= time_limit else 'red'
+        estimated.add_row(
+            fit.model.name,
+            f'{fit.error:.1%}',
+            f'[{color}]{predicted_ms:,.0f} ms[/]',
+            style='bold' if i == 0 else 'dim',
+        )
+
+    best = fits[0]
+    predicted_ms = best.predict_ns(max_n) / 1e6
+    if predicted_ms <= time_limit:
+        verdict = f'[green][+][/] 計算量は{best.model.name}と推定され, n={max_n:,} でも制限時間 {time_limit} ms に収まる見込みです'
+    else:
+        verdict = f'[red][-][/] 計算量は{best.model.name}と推定され, n={max_n:,} では約{predicted_ms:,.0f} msかかり制限時間 {time_limit} ms を超える見込みです'
+    return Group(measured, estimated, verdict)
+
+
+def complexity(
+    generator: str,
+    solution: str,
+    max_n: int = 200000,
+    steps: int = 8,
+    repeat: int = 3,
+    seed: int = 0,
+    time_limit: Optional[int] = None,
+) -> None:
+    for path in (generator, solution):
+        if not os.path.isfile(path):
+            print(f'[red][-][/] {path} が見つかりません')
+            return
+
+    if time_limit is None:
+        html_path = find_problem_html()
+        if html_path:
+            time_limit = TestCaseCache(html_path).load().limits.time_limit
+        time_limit = time_limit or DEFAULT_TIME_LIMIT
+
+    programs = [prepare_program(path) for path in (generator, solution)]
+    try:
+        if not check_compiled((generator, solution), programs):
+            return
+
+        estimator = ComplexityEstimator(
+            programs[0], programs[1], time_limit=time_limit, repeat=repeat
+        )
+        progress = Progress(
+            SpinnerColumn(style='white', spinner_name='circleHalves'),
+            TextColumn('{task.description}'),
+            TimeElapsedColumn(),
+        )
+        with progress:
+            samples, message = estimator.run(input_sizes(max_n, steps), seed, progress)
+    finally:
+        for program in programs:
+            program.cleanup()
+
+    if message:
+        print(f'[red][-][/] {message}')
+    if len(samples) < 3:
+        print('[red][-][/] 計算量を推定するには3種類以上の入力サイズでの計測が必要です')
+        return
+    fits = fit_models(samples)
+    print(create_renderable_complexity(samples, fits, max_n, time_limit))
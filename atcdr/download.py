@@ -1,62 +1,110 @@
 import os
 import re
 import time
-from typing import Callable, List, Union, cast
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, List, Optional, Union, cast
 
 import questionary as q
+import requests
 from rich import print
+from rich.progress import (
+    BarColumn,
+    MofNCompleteColumn,
+    Progress,
+    SpinnerColumn,
+    TextColumn,
+    TimeRemainingColumn,
+)
 from rich.prompt import Prompt
 
+from atcdr.util.download_journal import DownloadJournal
 from atcdr.util.filetype import FILE_EXTENSIONS, Lang
+from atcdr.util.http_cache import HttpCache, OfflineCacheMiss, install_cache
 from atcdr.util.parse import ProblemHTML
 from atcdr.util.problem import Contest, Diff, Problem
+from atcdr.util.ratelimit import TokenBucket
+from atcdr.util.retry import (
+    CONNECTION_ERROR_RULE,
+    RetryPolicy,
+    SharedBackoff,
+    parse_retry_after,
+)
 from atcdr.util.session import load_session
 
+# 同時にダウンロードする数と, atcoder.jp 全体への1秒あたりのリクエスト数の既定値
+DEFAULT_DOWNLOAD_JOBS = 4
+DEFAULT_REQUEST_RATE = 2.0
+REQUEST_TIMEOUT = 30  # 秒
+
 
 class Downloader:
-    def __init__(self) -> None:
-        self.session = load_session()
+    """問題のHTMLを取得する. 複数のスレッドから同時に使える.
+
+    rate_limiterを渡すと, すべてのリクエストの前にトークンを取得する.
+    失敗したときはpolicyに従って再試行する. 429などで待つときはbackoffを通して
+    同じDownloaderを使うすべてのスレッドが待つ.
+    ページはcacheに保存し, 次からは変更があったときだけ本文を受け取る.
+    """
+
+    def __init__(
+        self,
+        session: Optional[requests.Session] = None,
+        rate_limiter: Optional[TokenBucket] = None,
+        jobs: int = 1,
+        policy: Optional[RetryPolicy] = None,
+        cache: Optional[HttpCache] = None,
+    ) -> None:
+        self.session = session or load_session()
+        self.rate_limiter = rate_limiter
+        self.policy = policy or RetryPolicy()
+        self.backoff = SharedBackoff()
+        self.cache = cache or HttpCache()
+        install_cache(self.session, self.cache, jobs)
 
     def get(self, problem: Problem) -> ProblemHTML:
-        session = self.session
-        retry_attempts = 3
-        retry_wait = 1  # 1 second
-
-        for _ in range(retry_attempts):
-            response = session.get(problem.url)
-            if response.status_code == 200:
-                return ProblemHTML(response.text)
-            elif response.status_code == 429:
-                print(
-                    f'[bold yellow][Error {response.status_code}][/bold yellow] 再試行します。{problem}'
-                )
-                time.sleep(retry_wait)
-            elif 300 <= response.status_code < 400:
-                print(
-                    f'[bold yellow][Error {response.status_code}][/bold yellow] リダイレクトが発生しました。{problem}'
-                )
-            elif 400 <= response.status_code < 500:
+        policy = self.policy
+        for attempt in range(policy.max_attempts):
+            # キャッシュから返せるときはリクエストを送らないので待たない
+            if not self.cache.has_fresh(problem.url):
+                self.backoff.wait()
+                if self.rate_limiter:
+                    self.rate_limiter.acquire()
+
+            retry_after = None
+            try:
+                response = self.session.get(problem.url, timeout=REQUEST_TIMEOUT)
+            except OfflineCacheMiss:
                 print(
-                    f'[bold red][Error {response.status_code}][/bold red] 問題が見つかりません。{problem}'
-                )
-                break
-            elif 500 <= response.status_code < 600:
-                print(
-                    f'[bold red][Error {response.status_code}][/bold red] サーバーエラーが発生しました。{problem}'
+                    f'[bold red][Offline][/bold red] キャッシュがありません。{problem}'
                 )
                 break
+            except requests.RequestException as e:
+                rule = CONNECTION_ERROR_RULE
+                label = f'{type(e).__name__}'
             else:
-                print(
-                    f'[bold red][Error {response.status_code}][/bold red] {problem}に対応するHTMLファイルを取得できませんでした。'
-                )
+                if response.status_code == 200:
+                    self.backoff.succeeded()
+                    return ProblemHTML(response.text)
+                rule = policy.rule(response.status_code)
+                label = f'Error {response.status_code}'
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+
+            last_attempt = attempt + 1 >= policy.max_attempts
+            if not rule.retry or last_attempt:
+                print(f'[bold red][{label}][/bold red] {rule.message}。{problem}')
                 break
-        return ProblemHTML('')
-
 
-def mkdir(path: str) -> None:
-    if not os.path.exists(path):
-        os.makedirs(path)
-        print(f'[bold green][+][/bold green] フォルダー: {path} を作成しました')
+            if rule.shared:
+                delay = self.backoff.pause(policy, retry_after)
+            else:
+                delay = policy.delay(attempt, retry_after)
+            print(
+                f'[bold yellow][{label}][/bold yellow] {rule.message}。'
+                f'{delay:.1f}秒後に再試行します。{problem}'
+            )
+            if not rule.shared:
+                time.sleep(delay)
+        return ProblemHTML('')
 
 
 class GenerateMode:
@@ -83,34 +131,103 @@ def title_to_filename(title: str) -> str:
     return title
 
 
-def generate_problem_directory(
-    base_path: str, problems: List[Problem], gene_path: Callable[[str, Problem], str]
-) -> None:
-    downloader = Downloader()
-    for problem in problems:
-        problem_content = downloader.get(problem)
-        if not problem_content:
-            print(f'[bold red][Error][/] {problem}の保存に失敗しました')
-            continue
+def save_problem(
+    base_path: str,
+    problem: Problem,
+    problem_content: ProblemHTML,
+    gene_path: Callable[[str, Problem], str],
+) -> List[str]:
+    """取得した問題をHTMLとMarkdownで保存し, 保存したファイルのパスを返す."""
+    dir_path = gene_path(base_path, problem)
+    os.makedirs(dir_path, exist_ok=True)
 
-        dir_path = gene_path(base_path, problem)
-        mkdir(dir_path)
+    problem_content.repair_me()
 
-        problem_content.repair_me()
+    title = problem_content.title or problem.label
+    title = title_to_filename(title)
 
-        title = problem_content.title or problem.label
-        title = title_to_filename(title)
+    html_path = os.path.join(dir_path, title + FILE_EXTENSIONS[Lang.HTML])
+    with open(html_path, 'w', encoding='utf-8') as file:
+        file.write(problem_content.html)
 
-        html_path = os.path.join(dir_path, title + FILE_EXTENSIONS[Lang.HTML])
-        with open(html_path, 'w', encoding='utf-8') as file:
-            file.write(problem_content.html)
-        print(f'[bold green][+][/bold green] ファイルを保存しました :{html_path}')
+    md = problem_content.make_problem_markdown('ja')
+    md_path = os.path.join(dir_path, title + FILE_EXTENSIONS[Lang.MARKDOWN])
+    with open(md_path, 'w', encoding='utf-8') as file:
+        file.write(md)
+    return [html_path, md_path]
 
-        md = problem_content.make_problem_markdown('ja')
-        md_path = os.path.join(dir_path, title + FILE_EXTENSIONS[Lang.MARKDOWN])
-        with open(md_path, 'w', encoding='utf-8') as file:
-            file.write(md)
-        print(f'[bold green][+][/bold green] ファイルを保存しました :{md_path}')
+
+def generate_problem_directory(
+    base_path: str,
+    problems: List[Problem],
+    gene_path: Callable[[str, Problem], str],
+    jobs: int = DEFAULT_DOWNLOAD_JOBS,
+    rate: float = DEFAULT_REQUEST_RATE,
+    cache: Optional[HttpCache] = None,
+    force: bool = False,
+) -> None:
+    """問題をjobs個ずつ並行してダウンロードする.
+
+    すべてのスレッドで1つのレート制限を共有するので, atcoder.jp へのリクエストは
+    合わせて毎秒rate回までになる. 進み具合は1本のプログレスバーで表示する.
+    結果はbase_pathの記録に残し, 前回までに保存した問題はforceでなければ取得しない.
+    """
+    journal = DownloadJournal(base_path)
+    pending = [
+        problem
+        for problem in problems
+        if force or not journal.is_done(problem.url, gene_path(base_path, problem))
+    ]
+    skipped = len(problems) - len(pending)
+    if skipped:
+        print(f'[bold blue][*][/bold blue] 保存済みの{skipped}問は飛ばします')
+    if not pending:
+        print(f'[bold green][+][/bold green] {len(problems)} 問すべて保存済みです')
+        return
+
+    jobs = max(1, min(jobs, len(pending)))
+    downloader = Downloader(
+        rate_limiter=TokenBucket(rate, capacity=jobs), jobs=jobs, cache=cache
+    )
+
+    def fetch(problem: Problem) -> Optional[List[str]]:
+        problem_content = downloader.get(problem)
+        if not problem_content:
+            return None
+        return save_problem(base_path, problem, problem_content, gene_path)
+
+    progress = Progress(
+        SpinnerColumn(style='white', spinner_name='circleHalves'),
+        TextColumn('{task.description}'),
+        BarColumn(),
+        MofNCompleteColumn(),
+        TimeRemainingColumn(),
+    )
+    saved = 0
+    with progress, ThreadPoolExecutor(max_workers=jobs) as executor:
+        task_id = progress.add_task('問題をダウンロード中', total=len(pending))
+        futures = {executor.submit(fetch, problem): problem for problem in pending}
+        for future in as_completed(futures):
+            problem = futures[future]
+            try:
+                paths = future.result()
+            except (requests.RequestException, OSError) as e:
+                progress.console.print(f'[bold red][Error][/] {problem}: {e}')
+                paths = None
+            if paths is None:
+                progress.console.print(
+                    f'[bold red][Error][/] {problem}の保存に失敗しました'
+                )
+                journal.failed(problem.url)
+            else:
+                journal.done(problem.url, paths)
+                saved += 1
+            progress.advance(task_id)
+        progress.update(task_id, description='ダウンロード完了')
+
+    print(
+        f'[bold green][+][/bold green] {saved + skipped} / {len(problems)} 問を保存しました'
+    )
 
 
 def parse_range(match: re.Match) -> List[int]:
@@ -147,7 +264,24 @@ def are_all_diffs(args: Union[List[int], List[Diff]]) -> bool:
     return all(isinstance(arg, Diff) for arg in args)
 
 
-def interactive_download() -> None:
+def contest_problems(
+    contest: Contest, session: requests.Session, refresh: bool
+) -> Optional[List[Problem]]:
+    try:
+        return contest.problems(session=session, refresh=refresh)
+    except OfflineCacheMiss:
+        print(
+            f'[bold red][Offline][/bold red] {contest}の問題一覧のキャッシュがありません'
+        )
+        return None
+
+
+def interactive_download(
+    jobs: int = DEFAULT_DOWNLOAD_JOBS,
+    rate: float = DEFAULT_REQUEST_RATE,
+    cache: Optional[HttpCache] = None,
+    force: bool = False,
+) -> None:
     CONTEST = '1. コンテストの問題を解きたい'
     PRACTICE = '2. 特定の難易度の問題を集中的に練習したい'
     ONE_FILE = '3. 1問だけダウンロードする'
@@ -170,16 +304,21 @@ def interactive_download() -> None:
         ),
     ).ask()
 
-    session = load_session()
+    cache = cache or HttpCache()
+    session = install_cache(load_session(), cache)
 
     if choice == CONTEST:
         name = Prompt.ask(
             'コンテスト名を入力してください (例: abc012, abs, typical90)',
         )
 
-        problems = Contest(name=name).problems(session=session)
+        problems = contest_problems(Contest(name=name), session, force)
+        if problems is None:
+            return
 
-        generate_problem_directory('.', problems, GenerateMode.gene_path_on_num)
+        generate_problem_directory(
+            '.', problems, GenerateMode.gene_path_on_num, jobs, rate, cache, force
+        )
 
     elif choice == PRACTICE:
         difficulty = Prompt.ask(
@@ -204,14 +343,18 @@ def interactive_download() -> None:
             for number in contest_numbers
         ]
 
-        generate_problem_directory('.', problems, GenerateMode.gene_path_on_diff)
+        generate_problem_directory(
+            '.', problems, GenerateMode.gene_path_on_diff, jobs, rate, cache, force
+        )
 
     elif choice == ONE_FILE:
         name = Prompt.ask(
             'コンテスト名を入力してください (例: abc012, abs, typical90)',
         )
 
-        problems = Contest(name=name).problems(session=session)
+        problems = contest_problems(Contest(name=name), session, force)
+        if problems is None:
+            return
 
         problem = q.select(
             message='どの問題をダウンロードしますか?',
@@ -233,7 +376,9 @@ def interactive_download() -> None:
             ),
         ).ask()
 
-        generate_problem_directory('.', [problem], GenerateMode.gene_path_on_num)
+        generate_problem_directory(
+            '.', [problem], GenerateMode.gene_path_on_num, cache=cache, force=force
+        )
 
     elif choice == END:
         print('[bold red]終了します[/]')
@@ -245,9 +390,16 @@ def download(
     first: Union[str, int, None] = None,
     second: Union[str, int, None] = None,
     base_path: str = '.',
+    jobs: int = DEFAULT_DOWNLOAD_JOBS,
+    rate: float = DEFAULT_REQUEST_RATE,
+    cache_ttl: float = 0,
+    offline: bool = False,
+    force: bool = False,
 ) -> None:
+    # cache_ttl秒以内に取得したページは再検証もしない. offlineならネットワークを使わない
+    cache = HttpCache(ttl=cache_ttl, offline=offline)
     if first is None:
-        interactive_download()
+        interactive_download(jobs, rate, cache, force)
         return
 
     first_args = convert_arg(str(first))
@@ -271,7 +423,9 @@ def download(
             for number in first_args_int
             for diff in second_args_diff
         ]
-        generate_problem_directory(base_path, problems, GenerateMode.gene_path_on_num)
+        generate_problem_directory(
+            base_path, problems, GenerateMode.gene_path_on_num, jobs, rate, cache, force
+        )
     elif are_all_diffs(first_args) and are_all_integers(second_args):
         first_args_diff = cast(List[Diff], first_args)
         second_args_int = cast(List[int], second_args)
@@ -280,7 +434,15 @@ def download(
             for diff in first_args_diff
             for number in second_args_int
         ]
-        generate_problem_directory(base_path, problems, GenerateMode.gene_path_on_diff)
+        generate_problem_directory(
+            base_path,
+            problems,
+            GenerateMode.gene_path_on_diff,
+            jobs,
+            rate,
+            cache,
+            force,
+        )
     else:
         raise ValueError(
             """次のような形式で問題を指定してください
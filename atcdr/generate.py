@@ -6,7 +6,13 @@ from rich.console import Console
 from rich.panel import Panel
 from rich.syntax import Syntax
 
-from atcdr.test import ResultStatus, TestRunner, create_renderable_test_info
+from atcdr.test import (
+    DEFAULT_MEMORY_LIMIT,
+    DEFAULT_TIME_LIMIT,
+    ResultStatus,
+    TestRunner,
+    create_renderable_test_info,
+)
 from atcdr.util.cost import Model
 from atcdr.util.execute import execute_files
 from atcdr.util.filetype import (
@@ -18,6 +24,7 @@ from atcdr.util.filetype import (
 )
 from atcdr.util.gpt import ChatGPT, set_api_key
 from atcdr.util.parse import ProblemHTML
+from atcdr.util.preview import preview_text
 
 
 def get_code_from_gpt_output(output: str) -> str:
@@ -38,9 +45,9 @@ def render_result_for_GPT(
             return f'Compile Error \n {test.info.compiler_message}', False
         case _:
             message_for_gpt = ''.join(
-                f'\n{result.label} => {result.result.passed.value}\nInput :\n{result.testcase.input}\nOutput :\n{result.result.output}\nExpected :\n{result.testcase.output}\n'
+                f'\n{result.label} => {result.result.passed.value}\nInput :\n{preview_text(result.testcase.input)}\nOutput :\n{result.result.output}\nExpected :\n{preview_text(result.testcase.output, result.result.checker_line)}\n{result.result.checker_message}\n'
                 if result.result.passed == ResultStatus.WA
-                else f'\n{result.label} => {result.result.passed.value}\nInput :\n{result.testcase.input}\nOutput :\n{result.result.output}\n'
+                else f'\n{result.label} => {result.result.passed.value}\nInput :\n{preview_text(result.testcase.input)}\nOutput :\n{result.result.output}\n'
                 for result in results
             )
             return message_for_gpt, False
@@ -121,6 +128,7 @@ def solve_problem(file: Filename, lang: Lang, model: Model) -> None:
 
     md = html.make_problem_markdown('en')
     labeled_cases = html.load_labeled_testcase()
+    limits = html.load_limits()
 
     if set_api_key() is None:
         return
@@ -161,7 +169,14 @@ Please provide an updated version of the code in {lang2str(lang)}."""
         with console.status(
             f'{gpt.model.value}が生成したコードをテスト中', spinner='circleHalves'
         ):
-            test = TestRunner(saved_filename, labeled_cases)
+            test = TestRunner(
+                saved_filename,
+                labeled_cases,
+                time_limit=limits.time_limit or DEFAULT_TIME_LIMIT,
+                memory_limit=limits.memory_limit or DEFAULT_MEMORY_LIMIT,
+                fail_fast=True,  # フィードバックには最初に失敗したケースがあれば足りる
+                problem_url=html.link,
+            )
             test_report, is_ac = render_result_for_GPT(test)
 
         console.print(create_renderable_test_info(test.info))
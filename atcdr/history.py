@@ -0,0 +1,147 @@
+import os
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from rich import print
+from rich.console import Group, RenderableType
+from rich.table import Table
+from rich.text import Text
+
+from atcdr.util.history import PerformanceHistory, RunRecord
+from atcdr.util.testcase_cache import TestCaseCache, find_problem_html
+
+SPARK_CHARS = '▁▂▃▄▅▆▇█'
+
+
+def sparkline(values: List[Optional[int]]) -> str:
+    """値の推移を1行のグラフにする. 値のない回は空白にする."""
+    present = [v for v in values if v is not None]
+    if not present:
+        return ''
+    low, high = min(present), max(present)
+    span = (high - low) or 1
+    return ''.join(
+        ' ' if v is None else SPARK_CHARS[(v - low) * (len(SPARK_CHARS) - 1) // span]
+        for v in values
+    )
+
+
+def format_ms(time_ns: Optional[int]) -> str:
+    return '-' if time_ns is None else f'{time_ns / 1e6:.1f}'
+
+
+def create_renderable_history(runs: List[RunRecord]) -> RenderableType:
+    labels: List[str] = []
+    for run in runs:
+        labels += [case.label for case in run.cases if case.label not in labels]
+    times: Dict[str, List[Optional[int]]] = {
+        label: [
+            next(
+                (c.time_ns for c in run.cases if c.label == label and c.status == 'AC'),
+                None,
+            )
+            for run in runs
+        ]
+        for label in labels
+    }
+    best = {
+        label: min((t for t in values if t is not None), default=None)
+        for label, values in times.items()
+    }
+
+    # ケースが多くても横に広がらないように, 実行ごとの表には合計と最大だけを出す
+    table = Table(title=runs[-1].problem_url)
+    table.add_column('日時')
+    table.add_column('ファイル')
+    table.add_column('ハッシュ', style='dim')
+    table.add_column('条件', style='dim')
+    table.add_column('結果')
+    table.add_column('コンパイル', justify='right')
+    table.add_column('最大 (ms)', justify='right')
+    table.add_column('合計 (ms)', justify='right')
+    table.add_column('前回比', justify='right')
+
+    previous: Dict[Tuple[str, str], Dict[str, int]] = {}
+    for i, run in enumerate(runs):
+        measured = {
+            label: value
+            for label, values in times.items()
+            if (value := values[i]) is not None
+        }
+        total = sum(measured.values()) if measured else None
+        # 前回比は同じファイルを同じ条件で実行した前回と, 両方で計測できたケースだけで比べる
+        change = ''
+        before = previous.get((run.source, run.mode), {})
+        common = measured.keys() & before.keys()
+        if common:
+            ratio = sum(measured[k] for k in common) / sum(before[k] for k in common)
+            color = 'red' if ratio > 1 else 'green'
+            change = f'[{color}]{(ratio - 1) * 100:+.0f}%[/]'
+        if measured:
+            previous[(run.source, run.mode)] = measured
+        table.add_row(
+            datetime.fromtimestamp(run.created_at).strftime('%m/%d %H:%M'),
+            run.source,
+            run.source_hash[:8],
+            run.mode or '-',
+            Text(run.summary, style='green' if run.summary == 'AC' else 'red'),
+            '-' if run.compile_time is None else f'{run.compile_time} ms',
+            format_ms(max(measured.values())) if measured else '-',
+            format_ms(total),
+            change,
+        )
+
+    trend = Table(title='ケースごとの推移 (古い順)', show_header=True)
+    trend.add_column('ケース')
+    trend.add_column('推移')
+    trend.add_column('最速 (ms)', justify='right')
+    trend.add_column('最新 (ms)', justify='right')
+    for label in labels:
+        trend.add_row(
+            label,
+            Text(sparkline(times[label]), style='cyan'),
+            format_ms(best[label]),
+            format_ms(times[label][-1]),
+        )
+    return Group(table, trend)
+
+
+def create_renderable_problems(history: PerformanceHistory) -> RenderableType:
+    table = Table(title='記録のある問題')
+    table.add_column('問題')
+    table.add_column('実行回数', justify='right')
+    table.add_column('AC', justify='right')
+    table.add_column('最後の実行')
+    for row in history.problems():
+        table.add_row(
+            row['problem_url'],
+            str(row['count']),
+            str(row['accepted']),
+            datetime.fromtimestamp(row['last_run']).strftime('%Y/%m/%d %H:%M'),
+        )
+    return table
+
+
+def history(*args: str, limit: int = 20, problems: bool = False) -> None:
+    """このディレクトリーの問題でテストした結果の推移を表示する.
+
+    ファイル名を指定するとそのファイルの記録だけを表示する. --problems で記録のある問題の一覧を表示する.
+    """
+    store = PerformanceHistory()
+    if problems:
+        print(create_renderable_problems(store))
+        return
+
+    html_path = find_problem_html()
+    if html_path is None:
+        print(
+            '問題のファイルが見つかりません。\n問題のファイルが存在するディレクトリーに移動してから実行してください。'
+        )
+        return
+    url = TestCaseCache(html_path).load().url
+    sources = [os.path.normpath(arg) for arg in args]
+    runs = store.runs(url, sources or None, limit)
+    if not runs:
+        print('[yellow]この問題のテストの記録はまだありません[/]')
+        return
+    print(create_renderable_history(runs))
@@ -1,46 +1,53 @@
+import sys
+from importlib import import_module
 from importlib.metadata import metadata
+from typing import Callable, Dict, Tuple
 
 import fire  # type: ignore
 from rich.traceback import install
 
-from atcdr.download import download
-from atcdr.generate import generate
-from atcdr.login import login
-from atcdr.logout import logout
-from atcdr.markdown import markdown
-from atcdr.open import open_files
-from atcdr.submit import submit
-from atcdr.test import test
-
 
 def get_version() -> None:
     meta = metadata('AtCoderStudyBooster')
     print(meta['Name'], meta['Version'])
 
 
-MAP_COMMANDS: dict = {
-    'test': test,
-    't': test,
-    'download': download,
-    'd': download,
-    'open': open_files,
-    'o': open_files,
-    'generate': generate,
-    'g': generate,
-    'markdown': markdown,
-    'md': markdown,
-    'login': login,
-    'logout': logout,
-    'submit': submit,
-    's': submit,
-    '--version': get_version,
-    '-v': get_version,
+# コマンドごとのモジュールは実行するものだけを読み込む.
+# bs4やopenaiなどの読み込みは遅いので, atcdr t などの起動を速くするため
+MAP_COMMANDS: Dict[str, Tuple[str, str]] = {
+    'test': ('atcdr.test', 'test'),
+    't': ('atcdr.test', 'test'),
+    'download': ('atcdr.download', 'download'),
+    'd': ('atcdr.download', 'download'),
+    'open': ('atcdr.open', 'open_files'),
+    'o': ('atcdr.open', 'open_files'),
+    'generate': ('atcdr.generate', 'generate'),
+    'g': ('atcdr.generate', 'generate'),
+    'markdown': ('atcdr.markdown', 'markdown'),
+    'md': ('atcdr.markdown', 'markdown'),
+    'login': ('atcdr.login', 'login'),
+    'logout': ('atcdr.logout', 'logout'),
+    'submit': ('atcdr.submit', 'submit'),
+    's': ('atcdr.submit', 'submit'),
+    'stress': ('atcdr.stress', 'stress'),
+    'complexity': ('atcdr.complexity', 'complexity'),
+    'history': ('atcdr.history', 'history'),
 }
 
 
+def load_command(name: str) -> Callable:
+    module, func = MAP_COMMANDS[name]
+    return getattr(import_module(module), func)
+
+
 def main():
     install()
-    fire.Fire(MAP_COMMANDS)
+    name = sys.argv[1] if len(sys.argv) > 1 else None
+    if name in MAP_COMMANDS:
+        commands = {name: load_command(name)}
+    else:
+        commands = {name: load_command(name) for name in MAP_COMMANDS}
+    fire.Fire({**commands, '--version': get_version, '-v': get_version})
 
 
 if __name__ == '__main__':
@@ -0,0 +1,234 @@
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Set
+
+from rich import print
+from rich.console import Group
+from rich.progress import (
+    BarColumn,
+    MofNCompleteColumn,
+    Progress,
+    SpinnerColumn,
+    TextColumn,
+    TimeElapsedColumn,
+)
+
+from atcdr.test import (
+    DEFAULT_TIME_LIMIT,
+    LabeledTestCaseResult,
+    PreparedProgram,
+    ResultStatus,
+    TestCase,
+    TestInformation,
+    create_renderable_test_info,
+    create_renderable_test_result,
+    physical_cpu_count,
+    prepare_program,
+    run_code,
+)
+from atcdr.util.filetype import Lang, detect_language
+from atcdr.util.process import ForkServer, ProcessResult, run_process
+
+# 愚直解は遅くてもよいので, 制限時間をこの倍率まで緩める
+NAIVE_TIME_LIMIT_FACTOR = 10
+# 高速な解がACしなかったときに表示する理由
+FAILURE_REASONS = {
+    ResultStatus.WA: '愚直解と出力が一致しませんでした',
+    ResultStatus.TLE: '実行時間制限を超えました',
+    ResultStatus.MLE: 'メモリ制限を超えました',
+    ResultStatus.RE: '実行時エラーで終了しました',
+}
+
+
+@dataclass
+class StressFailure:
+    seed: int
+    reason: str
+    case: TestCase
+    result: Optional[LabeledTestCaseResult] = None
+
+
+class StressTester:
+    """ジェネレーターで作った入力に対して, 愚直解と高速な解の出力を比較する.
+
+    3つのプログラムは最初に1度だけコンパイルし, 各入力は計測用のラッパーを挟まずに実行する.
+    """
+
+    def __init__(
+        self,
+        generator: PreparedProgram,
+        naive: PreparedProgram,
+        fast: PreparedProgram,
+        time_limit: int = DEFAULT_TIME_LIMIT,
+    ) -> None:
+        self.generator = generator
+        self.naive = naive
+        self.fast = fast
+        self.time_limit = time_limit
+        self.servers: Dict[int, ForkServer] = {}
+
+    def __enter__(self) -> 'StressTester':
+        # Pythonのプログラムはインタープリターの起動を省くためにfork serverから実行する
+        if ForkServer.available():
+            for program in (self.generator, self.naive, self.fast):
+                if program.lang == Lang.PYTHON:
+                    server = ForkServer(program.cmd[0], program.cmd[-1], [])
+                    server.start()
+                    self.servers[id(program)] = server
+        return self
+
+    def __exit__(self, *_) -> None:
+        for server in self.servers.values():
+            server.close()
+
+    def _run(
+        self, program: PreparedProgram, input: bytes, args: Sequence[str] = ()
+    ) -> ProcessResult:
+        timeout = self.time_limit * NAIVE_TIME_LIMIT_FACTOR / 1000
+        server = self.servers.get(id(program))
+        if server:
+            return server.run(input, timeout, args=args)
+        return run_process([*program.cmd, *args], input, timeout, measure=False)
+
+    def run_once(self, seed: int) -> Optional[StressFailure]:
+        gen = self._run(self.generator, b'', [str(seed)])
+        if gen.returncode != 0 or gen.timed_out:
+            return StressFailure(
+                seed,
+                'ジェネレーターの実行に失敗しました',
+                TestCase(gen.stdout.decode(errors='replace'), ''),
+            )
+        input = gen.stdout.decode(errors='replace')
+
+        naive = self._run(self.naive, gen.stdout)
+        if naive.returncode != 0 or naive.timed_out:
+            return StressFailure(
+                seed, '愚直解の実行に失敗しました', TestCase(input, '')
+            )
+
+        case = TestCase(input, naive.stdout.decode(errors='replace'))
+        result = run_code(
+            self.fast.cmd,
+            case,
+            self.time_limit,
+            server=self.servers.get(id(self.fast)),
+            measure=False,
+        )
+        if result.passed == ResultStatus.AC:
+            return None
+        return StressFailure(
+            seed,
+            FAILURE_REASONS.get(result.passed, result.passed.value),
+            case,
+            LabeledTestCaseResult(f'seed {seed}', case, result),
+        )
+
+    def run(
+        self, count: int, jobs: int, first_seed: int, progress: Progress
+    ) -> Optional[StressFailure]:
+        task_id = progress.add_task('ストレステスト中', total=count)
+        seeds = iter(range(first_seed, first_seed + count))
+        failures: List[StressFailure] = []
+        pending: Set[Future] = set()
+
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            while True:
+                # 見つかった後に無駄な実行をしないよう, 投入するのは並列数の2倍までにする
+                while not failures and len(pending) < jobs * 2:
+                    seed = next(seeds, None)
+                    if seed is None:
+                        break
+                    pending.add(executor.submit(self.run_once, seed))
+                if not pending:
+                    break
+
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    progress.advance(task_id)
+                    failure = future.result()
+                    if failure is not None:
+                        failures.append(failure)
+                if failures:
+                    for future in pending:
+                        future.cancel()
+                    break
+
+        progress.update(task_id, description='ストレステスト完了')
+        return min(failures, key=lambda failure: failure.seed, default=None)
+
+
+def check_compiled(paths: Sequence[str], programs: List[PreparedProgram]) -> bool:
+    """コンパイルに失敗したプログラムがあればその結果を表示してFalseを返す."""
+    for path, program in zip(paths, programs):
+        if not program.ok:
+            info = TestInformation(
+                lang=detect_language(path), sourcename=path, case_number=0
+            )
+            info.results = [ResultStatus.CE]
+            info.compiler_message = (
+                program.compile_result.stderr if program.compile_result else ''
+            )
+            print(create_renderable_test_info(info))
+            return False
+    return True
+
+
+def save_failure(failure: StressFailure) -> str:
+    base = f'stress_{failure.seed}'
+    with open(base + '.in', 'w') as file:
+        file.write(failure.case.input)
+    with open(base + '.out', 'w') as file:
+        file.write(failure.case.output)
+    return base + '.in'
+
+
+def stress(
+    generator: str,
+    naive: str,
+    fast: str,
+    count: int = 1000,
+    jobs: Optional[int] = None,
+    seed: int = 0,
+    time_limit: int = DEFAULT_TIME_LIMIT,
+) -> None:
+    for path in (generator, naive, fast):
+        if not os.path.isfile(path):
+            print(f'[red][-][/] {path} が見つかりません')
+            return
+
+    programs = [prepare_program(path) for path in (generator, naive, fast)]
+    try:
+        if not check_compiled((generator, naive, fast), programs):
+            return
+
+        tester = StressTester(
+            programs[0], programs[1], programs[2], time_limit=time_limit
+        )
+        progress = Progress(
+            SpinnerColumn(style='white', spinner_name='circleHalves'),
+            TextColumn('{task.description}'),
+            BarColumn(),
+            MofNCompleteColumn(),
+            TimeElapsedColumn(),
+        )
+        start = time.perf_counter()
+        with tester, progress:
+            failure = tester.run(count, jobs or physical_cpu_count(), seed, progress)
+        elapsed = time.perf_counter() - start
+    finally:
+        for program in programs:
+            program.cleanup()
+
+    if failure is None:
+        print(
+            f'[green][+][/] {count}ケースすべてで出力が一致しました ({count / elapsed:.0f} ケース/秒)'
+        )
+        return
+
+    path = save_failure(failure)
+    print(f'[red][-][/] seed {failure.seed}: {failure.reason}')
+    if failure.result is not None:
+        print(Group(create_renderable_test_result(0, failure.result)))
+    print(f'[green][+][/] 入力を保存しました: {path}')
@@ -1,4 +1,3 @@
-import os
 import re
 import time
 from typing import Dict, List, NamedTuple, Optional
@@ -13,6 +12,8 @@ from rich.status import Status
 
 from atcdr.login import login
 from atcdr.test import (
+    DEFAULT_MEMORY_LIMIT,
+    DEFAULT_TIME_LIMIT,
     ResultStatus,
     TestInformation,
     TestRunner,
@@ -29,6 +30,7 @@ from atcdr.util.filetype import (
 )
 from atcdr.util.parse import ProblemHTML, get_csrf_token, get_submission_id
 from atcdr.util.session import load_session, validate_session
+from atcdr.util.testcase_cache import TestCaseCache, find_problem_html
 
 
 class LanguageOption(NamedTuple):
@@ -228,20 +230,23 @@ def submit_source(path: str, no_test: bool, no_feedback: bool) -> None:
             print('[red][-][/] ログインに失敗しました.')
             return
 
-    html_files = [file for file in os.listdir('.') if file.endswith('.html')]
-    if not html_files:
+    html_path = find_problem_html()
+    if html_path is None:
         print(
             '問題のファイルが見つかりません \n問題のファイルが存在するディレクトリーに移動してから実行してください'
         )
         return
 
-    with open(html_files[0], 'r') as file:
-        problem = ProblemHTML(file.read())
+    lcases, limits, url = TestCaseCache(html_path).load()
 
-    lcases = problem.load_labeled_testcase()
-    url = problem.link
-
-    test = TestRunner(path, lcases)
+    test = TestRunner(
+        path,
+        lcases,
+        time_limit=limits.time_limit or DEFAULT_TIME_LIMIT,
+        memory_limit=limits.memory_limit or DEFAULT_MEMORY_LIMIT,
+        fail_fast=True,
+        problem_url=url,
+    )
     list(test)
     print(create_renderable_test_info(test.info))
 
@@ -1,11 +1,25 @@
+import fnmatch
+import hashlib
+import itertools
+import json
+import math
 import os
+import shutil
+import sqlite3
+import statistics
 import subprocess
+import sys
 import tempfile
+import threading
 import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
 from dataclasses import dataclass, field
 from enum import Enum
-from typing import Dict, List, Optional, Tuple, Union
+from typing import Dict, Iterator, List, Optional, Tuple, Union
 
+from rich import print
 from rich.console import Group, RenderableType
 from rich.live import Live
 from rich.markup import escape
@@ -17,7 +31,10 @@ from rich.syntax import Syntax
 from rich.table import Table
 from rich.text import Text
 
-from atcdr.util.execute import execute_files
+from atcdr.util.checker import Checker, CheckerConfig, CheckerMode, Verdict
+from atcdr.util.compile_cache import CompileCache
+from atcdr.util.config import load_language_config
+from atcdr.util.execute import execute_files, find_target_files
 from atcdr.util.filetype import (
     COMPILED_LANGUAGES,
     INTERPRETED_LANGUAGES,
@@ -25,13 +42,41 @@ from atcdr.util.filetype import (
     detect_language,
     lang2str,
 )
-from atcdr.util.parse import ProblemHTML
+from atcdr.util.history import (
+    CaseRecord,
+    PerformanceHistory,
+    Regression,
+    RunRecord,
+    find_regressions,
+    run_mode,
+)
+from atcdr.util.jvm import JvmServer, jvm_options, main_class_name, with_cds_archive
+from atcdr.util.pch import pch_flags
+from atcdr.util.preview import (
+    OutputCapture,
+    discard,
+    mark_shown,
+    preview_text,
+    spill,
+)
+from atcdr.util.process import Cancellation, ForkServer, run_process
+from atcdr.util.profiler import Profiler, ProfileReport, create_profiler
+from atcdr.util.testcase_cache import (
+    CachedProblem,
+    ProblemLimits,
+    TestCaseCache,
+    find_problem_html,
+)
+from atcdr.util.watch import create_watcher
 
 
 @dataclass
 class TestCase:
     input: str
     output: str
+    # 全文を表示するときに示すファイル. なければ必要になったときに一時ファイルに書き出す
+    input_path: Optional[str] = None
+    output_path: Optional[str] = None
 
 
 @dataclass
@@ -54,8 +99,49 @@ class ResultStatus(Enum):
 class TestCaseResult:
     output: str
     executed_time: Union[int, None]
-    # memory_usage: Union[int, None]
     passed: ResultStatus
+    memory_usage: Union[int, None] = None  # KiB
+    user_time: Union[int, None] = None  # ms
+    sys_time: Union[int, None] = None  # ms
+    checker_message: str = ''
+    checker_line: Union[int, None] = None  # 最初に食い違った行
+    cold_time: Union[int, None] = None  # ms (fork server, JVM使用時の起動込みの推定)
+    wall_time_ns: Union[int, None] = None
+    bench: Optional['BenchmarkStats'] = None
+    output_path: Optional[str] = None  # 出力が大きいときに全文を書き出した一時ファイル
+    output_sha256: Optional[str] = None
+    profile: Optional[ProfileReport] = None
+
+
+@dataclass
+class BenchmarkStats:
+    samples_ns: List[int]
+
+    @property
+    def min_ns(self) -> int:
+        return min(self.samples_ns)
+
+    @property
+    def median_ns(self) -> float:
+        return statistics.median(self.samples_ns)
+
+    @property
+    def p95_ns(self) -> int:
+        ordered = sorted(self.samples_ns)
+        return ordered[max(0, math.ceil(len(ordered) * 0.95) - 1)]
+
+    @property
+    def stdev_ns(self) -> float:
+        return statistics.pstdev(self.samples_ns)
+
+    def to_dict(self) -> dict:
+        return {
+            'samples_ns': self.samples_ns,
+            'min_ns': self.min_ns,
+            'median_ns': self.median_ns,
+            'p95_ns': self.p95_ns,
+            'stdev_ns': self.stdev_ns,
+        }
 
 
 @dataclass
@@ -73,6 +159,9 @@ class TestInformation:
     results: List[ResultStatus] = field(default_factory=list)
     compiler_message: str = ''
     compile_time: Optional[int] = None
+    time_limit: Optional[int] = None
+    memory_limit: Optional[int] = None
+    cancelled: int = 0  # --fail-fastで実行しなかったケースの数
     _summary: Optional[ResultStatus] = None
 
     @property
@@ -125,95 +214,459 @@ class TestInformation:
         return self
 
 
+DEFAULT_TIME_LIMIT = 2000  # ms (AtCoderの標準的な実行時間制限)
+DEFAULT_MEMORY_LIMIT = 1024  # MiB (AtCoderの標準的なメモリ制限)
+# 制限時間を超えてもこの倍率までは打ち切らずに, どれだけ超過したかを計測する
+KILL_DEADLINE_FACTOR = 2
+
+# JVMやV8は起動時に巨大な仮想アドレス空間を予約するため, RLIMIT_ASをかけると起動できない
+VIRTUAL_MEMORY_HEAVY_LANGUAGES: List[Lang] = [Lang.JAVA, Lang.JAVASCRIPT]
+
+# --warm で使う起動済みのランナー. Pythonはfork server, JavaはJVMを使い回す
+Server = Union[ForkServer, JvmServer]
+
+
+def physical_cpu_count() -> int:
+    # 論理コア(SMT)で並列に走らせると実行時間が互いに干渉するので物理コア数を数える
+    logical = (
+        len(os.sched_getaffinity(0))
+        if hasattr(os, 'sched_getaffinity')
+        else os.cpu_count() or 1
+    )
+    cores = set()
+    try:
+        with open('/proc/cpuinfo') as file:
+            physical_id = ''
+            for line in file:
+                key, _, value = line.partition(':')
+                key = key.strip()
+                if key == 'physical id':
+                    physical_id = value.strip()
+                elif key == 'core id':
+                    cores.add((physical_id, value.strip()))
+    except OSError:
+        pass
+
+    return max(1, min(len(cores), logical)) if cores else max(1, logical)
+
+
 class TestRunner:
-    def __init__(self, path: str, lcases: List[LabeledTestCase]) -> None:
+    def __init__(
+        self,
+        path: str,
+        lcases: List[LabeledTestCase],
+        jobs: int = 1,
+        time_limit: int = DEFAULT_TIME_LIMIT,
+        memory_limit: Optional[int] = DEFAULT_MEMORY_LIMIT,
+        checker: Optional[CheckerConfig] = None,
+        warm: bool = False,
+        preload: Optional[List[str]] = None,
+        repeat: int = 1,
+        program: Optional['PreparedProgram'] = None,
+        cds: bool = False,
+        fail_fast: bool = False,
+        problem_url: Optional[str] = None,
+        compare: bool = False,
+        address_limit: bool = True,
+    ) -> None:
         self.source = path
-        self.lcases = iter(lcases)
+        self.lcases = lcases
+        # ベンチマーク中は他のケースと計測が干渉しないように1つずつ実行する
+        self.jobs = 1 if repeat > 1 else max(1, min(jobs, physical_cpu_count()))
+        self.repeat = max(1, repeat)
+        self.results: List[LabeledTestCaseResult] = []
+        self.time_limit = time_limit
+        self.memory_limit = memory_limit
+        self.checker = checker or CheckerConfig()
+        self.warm = warm
+        self.preload = preload or []
+        self.cds = cds
+        self.fail_fast = fail_fast
+        self.address_limit = address_limit
+        self.cancellation = Cancellation()
+        self.server: Optional[Server] = None
+        self.server_lock = threading.Lock()
+        self.compare = compare
+        self.mode = run_mode(False, self.repeat, self.jobs, compare)
+        # problem_urlがあれば, 結果を履歴に記録して以前の最速と比べる
+        self.problem_url = problem_url
+        self.history = PerformanceHistory() if problem_url else None
+        self.best_times: Dict[str, int] = {}
+        self.regressions: List[Regression] = []
+        # 渡されたプログラムは呼び出し側が使い回すので, ここでは片付けない
+        self.shared_program = program
         self.info = TestInformation(
             lang=detect_language(self.source),
             sourcename=path,
             case_number=len(lcases),
+            time_limit=time_limit,
+            memory_limit=memory_limit,
         )
 
     def __iter__(self):
         lang = self.info.lang
-        if lang in COMPILED_LANGUAGES:
-            exe_path, compile_result, compile_time = run_compile(self.source, lang)
-            self.info.compiler_message = compile_result.stderr
-            self.info.compile_time = compile_time
-            if compile_result.returncode != 0:
+        self.finished = False
+        self.program = self.shared_program or prepare_program(self.source, lang)
+        self.cmd = self.program.cmd
+        if self.program.compile_result is not None:
+            self.info.compiler_message = self.program.compile_result.stderr
+            self.info.compile_time = self.program.compile_time
+            if not self.program.ok:
                 self.info.results = [ResultStatus.CE]
+                self.record_history()
+                if self.shared_program is None:
+                    self.program.cleanup()
                 return iter([])
-
-            self.cmd = [
-                arg.format(source_path=self.source, exec_path=exe_path)
-                for arg in LANGUAGE_RUN_COMMANDS[lang]
-            ]
-            self.exe = exe_path
             run_code(self.cmd, TestCase(input='', output=''))  # バイナリーの慣らし運転
-        elif lang in INTERPRETED_LANGUAGES:
-            self.cmd = [
-                arg.format(source_path=self.source)
-                for arg in LANGUAGE_RUN_COMMANDS[lang]
-            ]
-            self.exe = None
-        else:
-            raise ValueError(f'{lang}の適切な言語のランナーが見つかりませんでした.')
-
+            if lang == Lang.JAVA:
+                self.start_java()
+        elif self.warm and lang == Lang.PYTHON and ForkServer.available(self.cmd[0]):
+            self.start_server(ForkServer(self.cmd[0], self.source, self.preload))
+
+        # 起動を省けたかどうかはサーバーを起動してみるまでわからないので, ここで決める
+        self.mode = run_mode(
+            self.server is not None, self.repeat, self.jobs, self.compare
+        )
+        if self.history and self.problem_url:
+            try:
+                self.best_times = self.history.best_times(
+                    self.problem_url, lang2str(lang), self.mode
+                )
+            except sqlite3.Error:
+                self.history = None
+
+        # ケースは並列に実行するが, 結果は渡された順に返す.
+        # --fail-fastでは失敗にすぐ気付けるように, 終わった順に返す
+        self.limit_address_space = (
+            self.address_limit and lang not in VIRTUAL_MEMORY_HEAVY_LANGUAGES
+        )
+        self.executor = ThreadPoolExecutor(max_workers=self.jobs)
+        submitted = {
+            self.executor.submit(self.run_case, lcase.case): lcase
+            for lcase in self.lcases
+        }
+        self.pending = set(submitted)
+        order = as_completed(submitted) if self.fail_fast else iter(submitted)
+        self.futures: Iterator[Tuple[LabeledTestCase, Future]] = (
+            (submitted[future], future) for future in order
+        )
         return self
 
+    def start_java(self) -> None:
+        assert self.program.exe
+        classpath = self.program.exe
+        main_class = main_class_name(classpath, self.source)
+        if self.cds:
+            # 読み込まれるクラスがなるべく実際と同じになるように, 最初のケースの入力で作る
+            sample = self.lcases[0].case.input if self.lcases else ''
+            try:
+                self.cmd = with_cds_archive(self.cmd, classpath, sample.encode())
+            except OSError as e:
+                print(
+                    f'[yellow][!][/] CDSのアーカイブを作れませんでした: {e}',
+                    file=sys.stderr,
+                )
+        if self.warm and JvmServer.available():
+            self.start_server(
+                JvmServer(
+                    self.cmd[0], classpath, main_class, jvm_options(self.cmd), self.cds
+                )
+            )
+
+    def start_server(self, server: Server) -> None:
+        """serverを起動する. 起動できなければ, 毎回プロセスを起動して実行する."""
+        try:
+            server.start()
+        except (RuntimeError, OSError) as e:
+            print(f'[yellow][!][/] {e}. 通常の実行に切り替えます', file=sys.stderr)
+            return
+        self.server = server
+
+    def drop_server(self, server: Server, error: Exception) -> None:
+        # 実行中にサーバーが応答しなくなったので, 以後のケースは通常の実行に切り替える.
+        # 起動を省いた計測と省かない計測が混ざるので, この回は履歴に残さない
+        with self.server_lock:
+            if self.server is not server:
+                return
+            self.server = None
+            self.history = None
+        print(f'[yellow][!][/] {error}. 通常の実行に切り替えます', file=sys.stderr)
+        server.close()
+
+    def run_case(self, case: TestCase) -> TestCaseResult:
+        server = self.server
+        args = (
+            self.cmd,
+            case,
+            self.time_limit,
+            self.memory_limit,
+            self.limit_address_space,
+            self.checker,
+        )
+        try:
+            if self.repeat > 1:
+                return run_benchmark(
+                    *args, server, repeat=self.repeat, cancel=self.cancellation
+                )
+            return run_code(*args, server, cancel=self.cancellation)
+        except (RuntimeError, OSError) as e:
+            if server is None:
+                raise
+            self.drop_server(server, e)
+            return self.run_case(case)
+
+    def record_history(self) -> None:
+        """結果を履歴に記録し, 以前の最速より遅くなったケースをregressionsに入れる."""
+        if self.history is None or self.problem_url is None:
+            return
+        with open(self.source, 'rb') as file:
+            source_hash = hashlib.sha256(file.read()).hexdigest()
+        cases = [
+            CaseRecord(
+                lresult.label,
+                lresult.result.passed.name,
+                case_time_ns(lresult.result),
+                lresult.result.memory_usage,
+            )
+            for lresult in self.results
+        ]
+        self.regressions = find_regressions(self.best_times, cases)
+        try:
+            self.history.record(
+                RunRecord(
+                    problem_url=self.problem_url,
+                    source=os.path.normpath(self.source),
+                    source_hash=source_hash,
+                    lang=lang2str(self.info.lang),
+                    compile_time=self.info.compile_time,
+                    summary=self.info.summary.name,
+                    mode=self.mode,
+                    cases=cases,
+                )
+            )
+        except sqlite3.Error:
+            pass  # 履歴を残せなくてもテストの結果には影響させない
+
+    def cancel(self) -> None:
+        """まだ始まっていないケースを取り消し, 実行中のプロセスを終了させる."""
+        for future in self.pending:
+            future.cancel()
+        self.cancellation.cancel()
+        self.info.cancelled = len(self.pending)
+        self.futures = iter([])
+
     def __next__(self):
         try:
-            lcase = next(self.lcases)
-            result = run_code(self.cmd, lcase.case)
-            self.info += result
-            return LabeledTestCaseResult(lcase.label, lcase.case, result)
+            lcase, future = next(self.futures)
         except StopIteration:
-            if self.exe and os.path.exists(self.exe):
-                os.remove(self.exe)
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            if self.server:
+                self.server.close()
+            if self.shared_program is None:
+                self.program.cleanup()
+            if not self.finished:
+                self.finished = True
+                self.record_history()
             raise
 
+        result = future.result()
+        self.pending.discard(future)
+        self.info += result
+        lresult = LabeledTestCaseResult(lcase.label, lcase.case, result)
+        self.results.append(lresult)
+        if self.fail_fast and result.passed != ResultStatus.AC:
+            self.cancel()
+        return lresult
+
+
+def case_time_ns(result: TestCaseResult) -> Optional[int]:
+    # ベンチマークしたときは中央値で比べる
+    return int(result.bench.median_ns) if result.bench else result.wall_time_ns
+
+
+# メモリ確保に失敗したときに各言語が出力するメッセージ
+MEMORY_ERROR_PATTERNS = (
+    'MemoryError',
+    'std::bad_alloc',
+    'memory allocation of',
+    'Cannot allocate memory',
+    'out of memory',
+    'OutOfMemoryError',
+)
+
+
+# プロファイラーの下で実行するときに, 実行時間制限を緩める倍率
+PROFILE_TIME_LIMIT_FACTOR = 10
 
-def run_code(cmd: list, case: TestCase) -> TestCaseResult:
-    start_time = time.time()
+# メモリに保持する標準出力の上限 (バイト). 超えた分は一時ファイルに書き出す.
+# 判定自体は全出力に対して逐次行う
+OUTPUT_CAPTURE_LIMIT = 1024 * 1024
+
+
+def run_code(
+    cmd: list,
+    case: TestCase,
+    time_limit: int = DEFAULT_TIME_LIMIT,
+    memory_limit: Optional[int] = None,
+    limit_address_space: bool = False,
+    checker: Optional[CheckerConfig] = None,
+    server: Optional[Server] = None,
+    measure: bool = True,
+    cancel: Optional[Cancellation] = None,
+) -> TestCaseResult:
+    judge = (checker or CheckerConfig()).create(case.input, case.output, time_limit)
     try:
-        proc = subprocess.run(
-            cmd, input=case.input, text=True, capture_output=True, timeout=4
-        )
-        end_time = time.time()
-        executed_time = int((end_time - start_time) * 1000)
-    except subprocess.TimeoutExpired as e_proc:
-        end_time = time.time()
-        executed_time = int((end_time - start_time) * 1000)
-        stdout_text = e_proc.stdout.decode('utf-8') if e_proc.stdout is not None else ''
-        stderr_text = e_proc.stderr.decode('utf-8') if e_proc.stderr is not None else ''
-        text = stdout_text + '\n' + stderr_text
+        return _run_and_judge(
+            cmd,
+            case,
+            judge,
+            time_limit,
+            memory_limit,
+            limit_address_space,
+            server,
+            measure,
+            cancel,
+        )
+    finally:
+        judge.close()
+
+
+def _run_and_judge(
+    cmd: list,
+    case: TestCase,
+    judge: Checker,
+    time_limit: int,
+    memory_limit: Optional[int],
+    limit_address_space: bool,
+    server: Optional[Server],
+    measure: bool,
+    cancel: Optional[Cancellation],
+) -> TestCaseResult:
+    capture = OutputCapture(OUTPUT_CAPTURE_LIMIT)
+
+    def on_stdout(chunk: bytes) -> bool:
+        capture.write(chunk)
+        return judge.feed(chunk)
+
+    timeout = time_limit * KILL_DEADLINE_FACTOR / 1000
+    address_space_limit = memory_limit if limit_address_space else None
+    if server:
+        proc = server.run(
+            case.input.encode(),
+            timeout,
+            address_space_limit,
+            on_stdout,
+            cancel=cancel,
+        )
+    else:
+        proc = run_process(
+            cmd,
+            case.input.encode(),
+            timeout,
+            address_space_limit,
+            on_stdout,
+            measure,
+            cancel,
+        )
+    executed_time = proc.wall_time_ns // 1_000_000
+    # ジャッジと比べられるように, 実行時間制限は起動時間込みの推定で判定する
+    cold_time = (
+        (proc.wall_time_ns + server.startup_time_ns) // 1_000_000 if server else None
+    )
+    stderr_text = proc.stderr.decode('utf-8', errors='replace')
+
+    def result(
+        passed: ResultStatus,
+        verdict: Optional[Verdict] = None,
+        with_stderr: bool = False,
+    ) -> TestCaseResult:
+        # 結果には表示用に切り詰めた出力だけを持たせ, 全文は一時ファイルに残す.
+        # ACなら全文を示すことはないので, 書き出したファイルはすぐに消す
+        output = capture.preview(verdict.line if verdict else None)
+        if with_stderr:
+            output = output + '\n' + preview_text(stderr_text)
+        output_path = capture.path
+        if passed == ResultStatus.AC:
+            discard(output_path)
+            output_path = None
         return TestCaseResult(
-            output=text, executed_time=executed_time, passed=ResultStatus.TLE
+            output=output.strip(),
+            output_path=output_path,
+            output_sha256=capture.hash.hexdigest(),
+            executed_time=executed_time,
+            passed=passed,
+            checker_message=verdict.message if verdict else '',
+            checker_line=verdict.line if verdict else None,
+            cold_time=cold_time,
+            wall_time_ns=proc.wall_time_ns,
+            memory_usage=proc.max_rss,
+            user_time=int(proc.user_time * 1000)
+            if proc.user_time is not None
+            else None,
+            sys_time=int(proc.sys_time * 1000) if proc.sys_time is not None else None,
         )
 
+    # 食い違いを見つけた時点で打ち切ったので, 終了コードは見ずにWAとする
+    if proc.stopped:
+        return result(ResultStatus.WA, judge.finish())
+
+    if proc.timed_out or (cold_time or executed_time) > time_limit:
+        return result(ResultStatus.TLE, with_stderr=True)
+
+    # 最大RSSで判定する. エラーメッセージを見るのは, RSSを計測できなかったときと,
+    # 仮想メモリの上限のためにRSSが制限に届く前に確保に失敗したときだけ
+    allocation_failed = (
+        proc.returncode != 0
+        and (proc.max_rss is None or address_space_limit is not None)
+        and any(pattern in stderr_text for pattern in MEMORY_ERROR_PATTERNS)
+    )
+    if memory_limit is not None and (
+        (proc.max_rss is not None and proc.max_rss > memory_limit * 1024)
+        or allocation_failed
+    ):
+        return result(ResultStatus.MLE, with_stderr=True)
+
     # プロセスの終了コードを確認し、異常終了ならREを返す
     if proc.returncode != 0:
-        return TestCaseResult(
-            output=proc.stdout + '\n' + proc.stderr,
-            executed_time=executed_time,
-            passed=ResultStatus.RE,
-        )
+        return result(ResultStatus.RE, with_stderr=True)
 
     # 実際の出力と期待される出力を比較
-    actual_output = proc.stdout.strip()
-    expected_output = case.output.strip()
-
-    if actual_output != expected_output:
-        return TestCaseResult(
-            output=actual_output,
-            executed_time=executed_time,
-            passed=ResultStatus.WA,
-        )
+    verdict = judge.finish()
+    if not verdict.ok:
+        return result(ResultStatus.WA, verdict)
     else:
-        return TestCaseResult(
-            output=actual_output, executed_time=executed_time, passed=ResultStatus.AC
-        )
+        return result(ResultStatus.AC, verdict)
+
+
+def run_benchmark(
+    cmd: list,
+    case: TestCase,
+    time_limit: int = DEFAULT_TIME_LIMIT,
+    memory_limit: Optional[int] = None,
+    limit_address_space: bool = False,
+    checker: Optional[CheckerConfig] = None,
+    server: Optional[Server] = None,
+    repeat: int = 1,
+    cancel: Optional[Cancellation] = None,
+) -> TestCaseResult:
+    # 1回目はウォームアップとして判定だけに使い, 計測には含めない
+    args = (cmd, case, time_limit, memory_limit, limit_address_space, checker, server)
+    result = run_code(*args, cancel=cancel)
+    if result.passed in (ResultStatus.TLE, ResultStatus.CE):
+        return result
+
+    samples = []
+    for _ in range(repeat):
+        if cancel and cancel.cancelled:
+            break
+        sample = run_code(*args, cancel=cancel)
+        discard(sample.output_path)  # 表示するのは1回目の結果だけ
+        if sample.wall_time_ns is not None:
+            samples.append(sample.wall_time_ns)
+    if samples:
+        result.bench = BenchmarkStats(samples)
+        result.executed_time = int(result.bench.median_ns // 1_000_000)
+    return result
 
 
 LANGUAGE_RUN_COMMANDS: Dict[Lang, list] = {
@@ -222,33 +675,136 @@ LANGUAGE_RUN_COMMANDS: Dict[Lang, list] = {
     Lang.C: ['{exec_path}'],
     Lang.CPP: ['{exec_path}'],
     Lang.RUST: ['{exec_path}'],
-    Lang.JAVA: ['java', os.path.splitext(os.path.basename('{source_path}'))[0]],
+    Lang.JAVA: ['java', '-cp', '{exec_path}', '{class_name}'],
 }
 
+# 既定ではAtCoderのジャッジと同じ最適化と言語規格でコンパイルする.
+# atcdr.json の languages で言語ごとに上書きできる
 LANGUAGE_COMPILE_COMMANDS: Dict[Lang, list] = {
-    Lang.C: ['gcc', '{source_path}', '-o', '{exec_path}'],
-    Lang.CPP: ['g++', '{source_path}', '-o', '{exec_path}'],
-    Lang.RUST: ['rustc', '{source_path}', '-o', '{exec_path}'],
-    Lang.JAVA: ['javac', '{source_path}'],
+    Lang.C: [
+        'gcc',
+        '-std=gnu2x',
+        '-O2',
+        '-DONLINE_JUDGE',
+        '-DATCODER',
+        '-Wall',
+        '-Wextra',
+        '{source_path}',
+        '-o',
+        '{exec_path}',
+        '-lm',
+    ],
+    Lang.CPP: [
+        'g++',
+        '-std=gnu++20',
+        '-O2',
+        '-DONLINE_JUDGE',
+        '-DATCODER',
+        '-Wall',
+        '-Wextra',
+        '{source_path}',
+        '-o',
+        '{exec_path}',
+    ],
+    Lang.RUST: [
+        'rustc',
+        '--edition=2021',
+        '-C',
+        'opt-level=3',
+        '{source_path}',
+        '-o',
+        '{exec_path}',
+    ],
+    Lang.JAVA: ['javac', '-encoding', 'UTF-8', '-d', '{exec_path}', '{source_path}'],
 }
 
 
+def language_command(lang: Lang, kind: str) -> list:
+    """kindは 'compile' か 'run'. 設定ファイルに書かれていればそちらを使う."""
+    defaults = LANGUAGE_COMPILE_COMMANDS if kind == 'compile' else LANGUAGE_RUN_COMMANDS
+    return load_language_config().get(lang, {}).get(kind) or defaults[lang]
+
+
+@dataclass
+class PreparedProgram:
+    lang: Lang
+    cmd: list
+    exe: Optional[str] = None
+    compile_result: Optional[subprocess.CompletedProcess] = None
+    compile_time: Optional[int] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.compile_result is None or self.compile_result.returncode == 0
+
+    def cleanup(self) -> None:
+        # Javaではクラスファイルを置いたディレクトリーになる
+        if self.exe and os.path.isdir(self.exe):
+            shutil.rmtree(self.exe, ignore_errors=True)
+        elif self.exe and os.path.exists(self.exe):
+            os.remove(self.exe)
+
+
+def prepare_program(path: str, lang: Optional[Lang] = None) -> PreparedProgram:
+    """必要ならコンパイルして, ソースを実行するコマンドを組み立てる."""
+    lang = lang or detect_language(path)
+    if lang in COMPILED_LANGUAGES:
+        exe_path, compile_result, compile_time = run_compile(path, lang)
+        class_name = main_class_name(exe_path, path) if lang == Lang.JAVA else ''
+        cmd = [
+            arg.format(source_path=path, exec_path=exe_path, class_name=class_name)
+            for arg in language_command(lang, 'run')
+        ]
+        return PreparedProgram(lang, cmd, exe_path, compile_result, compile_time)
+    elif lang in INTERPRETED_LANGUAGES:
+        cmd = [arg.format(source_path=path) for arg in language_command(lang, 'run')]
+        return PreparedProgram(lang, cmd)
+    else:
+        raise ValueError(f'{lang}の適切な言語のランナーが見つかりませんでした.')
+
+
 def run_compile(
     path: str, lang: Lang
 ) -> Tuple[str, subprocess.CompletedProcess, Optional[int]]:
     with tempfile.NamedTemporaryFile(delete=True) as tmp:
         exec_path = tmp.name
-    cmd = [
-        arg.format(source_path=path, exec_path=exec_path)
-        for arg in LANGUAGE_COMPILE_COMMANDS[lang]
-    ]
-    start_time = time.time()
-    compile_result = subprocess.run(cmd, capture_output=True, text=True)
-    compile_time = int((time.time() - start_time) * 1000)
+    cmd_template = language_command(lang, 'compile')
+    cmd = [arg.format(source_path=path, exec_path=exec_path) for arg in cmd_template]
+
+    # javacはクラスファイルを他から隔離した一時ディレクトリーに出力させる.
+    # 生成物がディレクトリーになるのでキャッシュはしない
+    if lang == Lang.JAVA:
+        os.makedirs(exec_path)
+        return exec_path, *compile_command(cmd)
+
+    cache = CompileCache()
+    key = cache.key(path, cmd_template)
+    cached = cache.load(key, exec_path)
+    if cached is not None:
+        return (
+            exec_path,
+            subprocess.CompletedProcess(cmd, 0, stdout='', stderr=cached.stderr),
+            cached.compile_time,
+        )
+
+    # プリコンパイル済みヘッダーの場所は生成物に影響しないので, キャッシュのキーには含めない
+    if lang == Lang.CPP:
+        cmd[1:1] = pch_flags(cmd_template)
+
+    compile_result, compile_time = compile_command(cmd)
+    if compile_result.returncode == 0 and os.path.exists(exec_path):
+        cache.store(key, exec_path, compile_time, compile_result.stderr)
 
     return exec_path, compile_result, compile_time
 
 
+def compile_command(cmd: list) -> Tuple[subprocess.CompletedProcess, int]:
+    start_time = time.perf_counter_ns()
+    compile_result = subprocess.run(cmd, capture_output=True, text=True)
+    compile_time = (time.perf_counter_ns() - start_time) // 1_000_000
+    return compile_result, compile_time
+
+
 COLOR_MAP = {
     ResultStatus.AC: 'green',
     ResultStatus.WA: 'red',
@@ -287,9 +843,13 @@ STATUS_TEXT_MAP = {
     ),
 }
 
+STATUS_TEXT_WIDTH = max(text.cell_len for text in STATUS_TEXT_MAP.values())
+
 
 def create_renderable_test_info(
-    test_info: TestInformation, progress: Optional[Progress] = None
+    test_info: TestInformation,
+    progress: Optional[Progress] = None,
+    show_compiler_message: bool = True,
 ) -> RenderableType:
     components = []
 
@@ -305,10 +865,18 @@ def create_renderable_test_info(
         )
         if test_info.compile_time
         else Text(''),
+        Text.from_markup(
+            f'[italic #0f0f0f]制限: [not italic cyan]{test_info.time_limit}[/] ms / [not italic cyan]{test_info.memory_limit}[/] MiB[/]\n'
+        )
+        if test_info.time_limit
+        else Text(''),
         status_text,
         Text.from_markup(
             f'  [{COLOR_MAP[test_info.summary]} bold]{success_count}[/] / [white bold]{total_count}[/]'
         ),
+        Text.from_markup(f'  [dim](残り{test_info.cancelled}ケースは打ち切りました)[/]')
+        if test_info.cancelled
+        else Text(''),
     )
 
     if progress:
@@ -316,7 +884,7 @@ def create_renderable_test_info(
     else:
         components.append(Panel(header_text, expand=False))
 
-    if test_info.compiler_message:
+    if test_info.compiler_message and show_compiler_message:
         rule = Rule(
             title='コンパイラーのメッセージ',
             style=COLOR_MAP[ResultStatus.CE],
@@ -345,47 +913,151 @@ def create_renderable_test_result(
         STATUS_TEXT_MAP[test_result.result.passed],  # status_text をここに追加
     )
 
+    checker_text = None
+    if test_result.result.checker_message:
+        checker_text = Text.assemble(
+            '判定       ',
+            (
+                test_result.result.checker_message,
+                COLOR_MAP[test_result.result.passed],
+            ),
+        )
+
     execution_time_text = None
     if test_result.result.executed_time is not None:
         execution_time_text = Text.from_markup(
             f'実行時間   [cyan]{test_result.result.executed_time}[/cyan] ms'
         )
+        if test_result.result.cold_time is not None:
+            execution_time_text.append_text(
+                Text.from_markup(
+                    f' (起動込みの推定 [cyan]{test_result.result.cold_time}[/cyan] ms)'
+                )
+            )
+        if test_result.result.memory_usage is not None:
+            execution_time_text.append_text(
+                Text.from_markup(
+                    f'   メモリ [cyan]{test_result.result.memory_usage}[/cyan] KiB'
+                )
+            )
+
+    bench_text = None
+    if test_result.result.bench is not None:
+        bench = test_result.result.bench
+        bench_text = Text.from_markup(
+            f'計測 {len(bench.samples_ns)}回  最小 [cyan]{bench.min_ns / 1e6:.2f}[/] ms'
+            f' / 中央値 [cyan]{bench.median_ns / 1e6:.2f}[/] ms'
+            f' / p95 [cyan]{bench.p95_ns / 1e6:.2f}[/] ms'
+            f' / 標準偏差 [cyan]{bench.stdev_ns / 1e6:.2f}[/] ms'
+        )
+
+    # 大きな入力や出力は先頭と末尾 (WAなら食い違った行の前後) だけを表示し,
+    # 全文は一時ファイルに書き出してそのパスを示す
+    result = test_result.result
+    input_text = preview_text(test_result.testcase.input)
+    expected_text = preview_text(test_result.testcase.output, result.checker_line)
+    case = test_result.testcase
+    full_texts = []
+    if input_text != case.input:
+        if case.input_path is None:
+            case.input_path = spill(case.input.encode(), '.in')
+        full_texts.append(('入力', case.input_path))
+    if result.output_path:
+        full_texts.append(('出力', result.output_path))
+    if result.passed != ResultStatus.AC and expected_text != case.output:
+        if case.output_path is None:
+            case.output_path = spill(case.output.encode(), '.ans')
+        full_texts.append(('正解の出力', case.output_path))
+    for _, path in full_texts:
+        mark_shown(path)
 
     table = Table(show_header=True, header_style='bold')
     table.add_column('入力', style='cyan', min_width=10)
 
-    if test_result.result.passed != ResultStatus.AC:
+    if result.passed != ResultStatus.AC:
         table.add_column(
             '出力',
-            style=COLOR_MAP[test_result.result.passed],
+            style=COLOR_MAP[result.passed],
             min_width=10,
             overflow='fold',
         )
         table.add_column('正解の出力', style=COLOR_MAP[ResultStatus.AC], min_width=10)
-        table.add_row(
-            escape(test_result.testcase.input),
-            escape(test_result.result.output),
-            escape(test_result.testcase.output),
-        )
+        table.add_row(escape(input_text), escape(result.output), escape(expected_text))
     else:
-        table.add_column(
-            '出力', style=COLOR_MAP[test_result.result.passed], min_width=10
+        table.add_column('出力', style=COLOR_MAP[result.passed], min_width=10)
+        table.add_row(escape(input_text), escape(result.output))
+
+    full_text = None
+    if full_texts:
+        full_text = Text.from_markup(
+            '\n'.join(
+                f'[italic]{name}の全文[/] {escape(path)}' for name, path in full_texts
+            )
         )
-        table.add_row(
-            escape(test_result.testcase.input), escape(test_result.result.output)
+
+    profile_table = None
+    if result.profile is not None:
+        profile_table = Table(
+            title=f'プロファイル (上位{len(result.profile.hotspots)}件)',
+            title_justify='left',
+            caption=escape(result.profile.path),
+            caption_justify='left',
         )
+        profile_table.add_column('関数', overflow='fold')
+        profile_table.add_column('割合', justify='right')
+        profile_table.add_column('自身の時間', justify='right')
+        profile_table.add_column('呼び出し回数', justify='right')
+        for hotspot in result.profile.hotspots:
+            profile_table.add_row(
+                escape(hotspot.name),
+                f'{hotspot.percent:.1f}%',
+                f'{hotspot.self_time:.1f} ms' if hotspot.self_time is not None else '',
+                str(hotspot.calls) if hotspot.calls is not None else '',
+            )
 
     components = [
         rule,
         status_header,
+        checker_text if checker_text else '',
         execution_time_text if execution_time_text else '',
+        bench_text if bench_text else '',
         table,
+        full_text if full_text else '',
+        profile_table if profile_table else '',
     ]
 
     return Group(*components)
 
 
-def render_results(test: TestRunner) -> None:
+def create_renderable_test_result_line(
+    i: int,
+    test_result: LabeledTestCaseResult,
+) -> RenderableType:
+    """1ケースを1行にまとめた表示. ケースが多いときに使う."""
+    result = test_result.result
+    line = Text.assemble(
+        (f'No.{i+1:<4}', 'bold'),
+        (f'{test_result.label:<16} ', COLOR_MAP[result.passed]),
+        STATUS_TEXT_MAP[result.passed],
+    )
+    # ステータスの長さを揃えて, 実行時間とメモリの列を縦に並べる
+    line.pad_right(STATUS_TEXT_WIDTH - STATUS_TEXT_MAP[result.passed].cell_len)
+    if result.executed_time is not None:
+        line.append_text(
+            Text.from_markup(f'  [cyan]{result.executed_time:>5}[/cyan] ms')
+        )
+    if result.memory_usage is not None:
+        line.append_text(
+            Text.from_markup(f'  [cyan]{result.memory_usage:>7}[/cyan] KiB')
+        )
+    if result.checker_message and result.passed != ResultStatus.AC:
+        line.append(f'  {result.checker_message}', style=COLOR_MAP[result.passed])
+    return line
+
+
+def render_results(
+    test: TestRunner, live: Optional[Live] = None, compact: bool = False
+) -> None:
     progress = Progress(
         SpinnerColumn(style='white', spinner_name='circleHalves'),
         TextColumn('{task.description}'),
@@ -394,37 +1066,631 @@ def render_results(test: TestRunner) -> None:
     )
     task_id = progress.add_task(description='テスト進行中', total=test.info.case_number)
 
-    current_display = [create_renderable_test_info(test.info, progress)]
+    def header() -> RenderableType:
+        return create_renderable_test_info(
+            test.info, progress, show_compiler_message=False
+        )
 
-    with Live(Group(*current_display)) as live:
+    # 終わったケースはLiveの上に1度だけ書き出し, Liveには見出しと進捗だけを残す.
+    # こうするとケースが増えても再描画の量は変わらない
+    with nullcontext(live) if live else Live(header()) as live:
+        live.update(header())
         for i, result in enumerate(test):
             progress.advance(task_id, advance=1)
-            current_display[-1] = create_renderable_test_info(test.info, progress)
-            current_display.insert(-1, (create_renderable_test_result(i, result)))
-            live.update(Group(*current_display))
-
+            if compact:
+                live.console.print(
+                    create_renderable_test_result_line(i, result),
+                    no_wrap=True,
+                    overflow='ellipsis',
+                )
+            else:
+                live.console.print(create_renderable_test_result(i, result))
+            live.update(header())
+
+        if test.regressions:
+            live.console.print(create_renderable_regressions(test.regressions))
         progress.update(task_id, description='テスト完了')  # 完了メッセージに更新
+        live.update(create_renderable_test_info(test.info, progress))
+
+
+def create_renderable_regressions(regressions: List[Regression]) -> RenderableType:
+    lines = [
+        Text.from_markup(
+            f'{escape(regression.label)}: 最速 [cyan]{regression.best_ns / 1e6:.1f}[/] ms'
+            f' → [yellow]{regression.time_ns / 1e6:.1f}[/] ms'
+            f' (+{(regression.time_ns / regression.best_ns - 1) * 100:.0f}%)'
+        )
+        for regression in regressions
+    ]
+    return Group(Rule(title='以前の最速より遅くなったケース', style='yellow'), *lines)
+
+
+@dataclass
+class TestOptions:
+    jobs: int = 1
+    time_limit: Optional[int] = None
+    memory_limit: Optional[int] = None
+    checker: CheckerConfig = field(default_factory=CheckerConfig)
+    warm: bool = False
+    preload: List[str] = field(default_factory=list)
+    cds: bool = False
+    bench: int = 1
+    bench_json: Optional[str] = None
+    watch: bool = False
+    compact: bool = False
+    profile: bool = False
+    profile_top: int = 10
+    profile_all: bool = False
+    fail_fast: bool = False
+    only: List[str] = field(default_factory=list)
+    slowest_first: bool = False
+    format: str = 'rich'
+    history: bool = True
+    address_limit: bool = True
+
+
+def export_benchmark(test: TestRunner, path: str) -> None:
+    data = {
+        'source': test.source,
+        'lang': lang2str(test.info.lang),
+        'compile_time': test.info.compile_time,
+        'cases': [
+            {
+                'label': lresult.label,
+                'status': lresult.result.passed.name,
+                'memory_usage': lresult.result.memory_usage,
+                **(lresult.result.bench.to_dict() if lresult.result.bench else {}),
+            }
+            for lresult in test.results
+        ],
+    }
+    with open(path, 'w') as file:
+        json.dump(data, file, indent=2)
+
+
+# 人が読むための表示の他に, CIなどで使う機械向けの出力形式
+OUTPUT_FORMATS = ('rich', 'jsonl', 'junit')
+
+
+def result_record(
+    source: str, lresult: LabeledTestCaseResult, best_ns: Optional[int] = None
+) -> dict:
+    result = lresult.result
+    return {
+        'source': source,
+        'label': lresult.label,
+        'status': result.passed.name,
+        'time_ms': result.executed_time,
+        'wall_time_ns': result.wall_time_ns,
+        'cold_time_ms': result.cold_time,
+        'user_time_ms': result.user_time,
+        'sys_time_ms': result.sys_time,
+        'memory_kib': result.memory_usage,
+        'output_sha256': result.output_sha256,
+        'checker_message': result.checker_message,
+        'previous_best_ns': best_ns,
+    }
+
+
+def write_jsonl_results(test: TestRunner) -> None:
+    """ケースが終わるたびに, 結果を1行のJSONとして標準出力に書き出す."""
+    for lresult in test:
+        sys.stdout.write(
+            json.dumps(
+                result_record(test.source, lresult, test.best_times.get(lresult.label)),
+                ensure_ascii=False,
+            )
+            + '\n'
+        )
+        sys.stdout.flush()
+    if test.info.summary == ResultStatus.CE:
+        record = {
+            'source': test.source,
+            'label': None,
+            'status': ResultStatus.CE.name,
+            'compiler_message': test.info.compiler_message,
+        }
+        sys.stdout.write(json.dumps(record, ensure_ascii=False) + '\n')
+        sys.stdout.flush()
+
+
+def junit_testsuite(test: TestRunner) -> ET.Element:
+    """テストを実行し, 結果をJUnit XMLのtestsuite要素にする.
+
+    WAはfailure, それ以外のAC以外はerror, --fail-fastで打ち切ったケースはskippedとする.
+    """
+    results = list(test)
+    suite = ET.Element('testsuite', name=test.source)
+    if test.info.summary == ResultStatus.CE:
+        case = ET.SubElement(suite, 'testcase', classname=test.source, name='compile')
+        error = ET.SubElement(case, 'error', type=ResultStatus.CE.name)
+        error.text = test.info.compiler_message
+
+    for lresult in results:
+        result = lresult.result
+        case = ET.SubElement(
+            suite,
+            'testcase',
+            classname=test.source,
+            name=lresult.label,
+            time=f'{(result.executed_time or 0) / 1000:.3f}',
+        )
+        if result.passed == ResultStatus.AC:
+            continue
+        tag = 'failure' if result.passed == ResultStatus.WA else 'error'
+        element = ET.SubElement(
+            case,
+            tag,
+            type=result.passed.name,
+            message=result.checker_message or result.passed.value,
+        )
+        element.text = result.output
+
+    finished = {lresult.label for lresult in results}
+    for lcase in test.lcases:
+        if test.info.summary != ResultStatus.CE and lcase.label not in finished:
+            case = ET.SubElement(
+                suite, 'testcase', classname=test.source, name=lcase.label
+            )
+            ET.SubElement(case, 'skipped')
+
+    cases = suite.findall('testcase')
+    suite.set('tests', str(len(cases)))
+    suite.set('failures', str(len(suite.findall('testcase/failure'))))
+    suite.set('errors', str(len(suite.findall('testcase/error'))))
+    suite.set('skipped', str(len(suite.findall('testcase/skipped'))))
+    suite.set('time', f'{sum(float(c.get("time", 0)) for c in cases):.3f}')
+    return suite
+
+
+def machine_readable_test(paths: List[str], options: TestOptions) -> None:
+    """--format jsonl/junit のときのテスト. Richの表示は一切組み立てない.
+
+    エラーメッセージは標準出力を汚さないように標準エラー出力へ書く.
+    テストを始められないときは, CIで気付けるように終了コード1で終了する.
+    """
+    html_path = find_problem_html()
+    if html_path is None:
+        sys.stderr.write('問題のファイルが見つかりません\n')
+        raise SystemExit(1)
+    problem = TestCaseCache(html_path).load()
+    lcases = select_cases(problem.lcases, options.only, options.slowest_first)
+    if not lcases:
+        sys.stderr.write(f'{", ".join(options.only)} に当てはまるケースがありません\n')
+        raise SystemExit(1)
+    if not paths:
+        sys.stderr.write('テストするファイルがありません\n')
+        raise SystemExit(1)
+
+    suites = ET.Element('testsuites')
+    for path in paths:
+        test = create_test_runner(
+            path, lcases, problem.limits, options, problem_url=problem.url
+        )
+        if options.format == 'jsonl':
+            write_jsonl_results(test)
+        else:
+            suites.append(junit_testsuite(test))
+
+    if options.format == 'junit':
+        ET.indent(suites)
+        sys.stdout.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        sys.stdout.write(ET.tostring(suites, encoding='unicode') + '\n')
+
+
+def create_renderable_comparison(
+    tests: List[TestRunner], lcases: List[LabeledTestCase]
+) -> RenderableType:
+    """ケースごとにステータスと実行時間をファイルごとに並べた表.
+
+    すべてのケースでACしたファイルのうち合計の実行時間が最も短いものと,
+    各ケースで最も速かったものを強調する.
+    """
+
+    def finished(test: TestRunner) -> bool:
+        return (
+            test.info.summary == ResultStatus.CE
+            or test.info.cancelled > 0
+            or len(test.results) == len(lcases)
+        )
 
+    def total_time(test: TestRunner) -> int:
+        return sum(lresult.result.executed_time or 0 for lresult in test.results)
 
-def run_test(path_of_code: str) -> None:
-    html_paths = [f for f in os.listdir('.') if f.endswith('.html')]
-    if not html_paths:
+    accepted = [
+        test
+        for test in tests
+        if finished(test) and test.info.summary == ResultStatus.AC
+    ]
+    fastest = min(accepted, key=total_time, default=None)
+
+    table = Table(header_style='bold', show_footer=True)
+    table.add_column('ケース', footer='合計')
+    for test in tests:
+        summary = test.info.summary if finished(test) else ResultStatus.WJ
+        footer = Text.assemble(
+            (summary.name, COLOR_MAP[summary]),
+            f' {total_time(test)} ms' if summary != ResultStatus.CE else '',
+        )
+        header = Text(test.source)
+        if test is fastest:
+            header = Text(f'★ {test.source}', style='bold green')
+            footer.stylize('bold')
+        table.add_column(header, footer=footer, justify='right')
+
+    # --fail-fastでは終わった順に結果が入るので, 位置ではなくラベルで引く
+    by_label = [
+        {lresult.label: lresult.result for lresult in test.results} for test in tests
+    ]
+    for lcase in lcases:
+        results = [found.get(lcase.label) for found in by_label]
+        times = [
+            result.executed_time
+            for result in results
+            if result and result.passed == ResultStatus.AC and result.executed_time
+        ]
+        best = min(times, default=None)
+        cells: List[RenderableType] = []
+        for test, result in zip(tests, results):
+            if result is None:
+                if test.info.summary == ResultStatus.CE:
+                    cells.append(Text('CE', style=COLOR_MAP[ResultStatus.CE]))
+                elif test.info.cancelled:
+                    cells.append(Text('-', style='dim'))  # 打ち切ったケース
+                else:
+                    cells.append(Text('WJ', style=COLOR_MAP[ResultStatus.WJ]))
+                continue
+            cell = Text.assemble(
+                (result.passed.name, COLOR_MAP[result.passed]),
+                f' {result.executed_time} ms',
+            )
+            if len(tests) > 1 and result.executed_time == best:
+                cell.stylize('bold')
+            cells.append(cell)
+        table.add_row(lcase.label, *cells)
+
+    return table
+
+
+def compare_tests(paths: List[str], options: TestOptions) -> None:
+    """複数のファイルを同時にテストし, 結果を1つの表にまとめる.
+
+    コンパイルはすべて並列に行い, 実行は計測が干渉しないよう物理コア数までに抑える.
+    """
+    ignored = [
+        flag
+        for flag, enabled in (
+            ('--profile', options.profile),
+            ('--bench_json', options.bench_json),
+            ('--compact', options.compact),
+        )
+        if enabled
+    ]
+    if ignored:
+        print(
+            f'[yellow][!][/] {", ".join(ignored)} は1つのファイルをテストするときだけ有効です'
+        )
+    problem = load_problem(options)
+    if problem is None:
+        return
+    lcases, limits, url = problem
+
+    with ThreadPoolExecutor(max_workers=len(paths)) as executor:
+        programs = list(executor.map(prepare_program, paths))
+    tests = [
+        create_test_runner(path, lcases, limits, options, program, url, compare=True)
+        for path, program in zip(paths, programs)
+    ]
+
+    try:
+        with Live(create_renderable_comparison(tests, lcases)) as live:
+
+            def run(test: TestRunner) -> None:
+                for _ in test:
+                    live.update(create_renderable_comparison(tests, lcases))
+
+            workers = max(1, physical_cpu_count() // max(1, options.jobs))
+            with ThreadPoolExecutor(max_workers=min(len(tests), workers)) as executor:
+                list(executor.map(run, tests))
+            live.update(create_renderable_comparison(tests, lcases))
+    finally:
+        for program in programs:
+            program.cleanup()
+
+
+def profile_case(
+    profiler: Profiler,
+    program: PreparedProgram,
+    lresult: LabeledTestCaseResult,
+    time_limit: int,
+    top: int,
+) -> Optional[ProfileReport]:
+    """プロファイラーの下でケースを実行する. 結果が得られなければ理由を表示してNone."""
+    # プロファイラーを挟むと数倍遅くなるので, 制限時間内に終わって結果が書き出されるように緩める
+    process = run_process(
+        profiler.wrap(program.cmd),
+        lresult.testcase.input.encode(),
+        time_limit * PROFILE_TIME_LIMIT_FACTOR / 1000,
+        measure=False,
+    )
+    hotspots = profiler.hotspots(top) if profiler.collected() else []
+    if not hotspots:
+        if process.timed_out:
+            reason = f'{time_limit * PROFILE_TIME_LIMIT_FACTOR} msで終わりませんでした'
+        elif process.returncode != 0:
+            reason = f'終了コード {process.returncode} で終了しました'
+        else:
+            reason = 'プロファイラーが結果を書き出しませんでした'
+        print(
+            f'[yellow][-][/] {lresult.label}のプロファイルは取れませんでした ({reason})'
+        )
+        return None
+    return ProfileReport(profiler.path, hotspots)
+
+
+def profile_results(
+    test: TestRunner, program: PreparedProgram, options: TestOptions
+) -> None:
+    """最も遅かったケース (profile_allならすべてのケース) をプロファイラーの下で実行し直す."""
+    if not test.results:
+        return
+    if options.profile_all:
+        targets = list(enumerate(test.results))
+    else:
+        targets = [
+            max(
+                enumerate(test.results),
+                key=lambda item: item[1].result.executed_time or 0,
+            )
+        ]
+
+    for i, lresult in targets:
+        profiler = create_profiler(program.lang, lresult.label)
+        if profiler is None:
+            print(
+                f'[red][-][/] {lang2str(program.lang)}のプロファイルには対応していません'
+                + ('' if program.lang == Lang.PYTHON else ' (perfが必要です)')
+            )
+            return
+        report = profile_case(
+            profiler, program, lresult, test.time_limit, options.profile_top
+        )
+        if report is None:
+            continue
+        lresult.result.profile = report
+        print(create_renderable_test_result(i, lresult))
+
+
+def select_cases(
+    lcases: List[LabeledTestCase], only: List[str], slowest_first: bool = False
+) -> List[LabeledTestCase]:
+    """--only と --slowest-first に従ってケースを選び, 並べ替える.
+
+    onlyの各要素はラベルに対するワイルドカード (大文字小文字は区別しない) か, 1から数えた
+    ケースの番号. 時間のかかるケースは入力も大きいことが多いので, 入力の大きい順に並べる.
+    """
+    if only:
+        patterns = [pattern.lower() for pattern in only]
+        lcases = [
+            lcase
+            for number, lcase in enumerate(lcases, start=1)
+            if str(number) in patterns
+            or any(fnmatch.fnmatch(lcase.label.lower(), p) for p in patterns)
+        ]
+    if slowest_first:
+        lcases = sorted(lcases, key=lambda lcase: len(lcase.case.input), reverse=True)
+    return lcases
+
+
+def load_problem(options: Optional[TestOptions] = None) -> Optional[CachedProblem]:
+    html_path = find_problem_html()
+    if html_path is None:
         print(
             '問題のファイルが見つかりません。\n問題のファイルが存在するディレクトリーに移動してから実行してください。'
         )
+        return None
+
+    problem = TestCaseCache(html_path).load()
+    if options is None:
+        return problem
+    lcases = select_cases(problem.lcases, options.only, options.slowest_first)
+    if not lcases:
+        print(f'[red][-][/] {", ".join(options.only)} に当てはまるケースがありません')
+        return None
+    return problem._replace(lcases=lcases)
+
+
+def create_test_runner(
+    path_of_code: str,
+    lcases: List[LabeledTestCase],
+    limits: ProblemLimits,
+    options: TestOptions,
+    program: Optional[PreparedProgram] = None,
+    problem_url: Optional[str] = None,
+    compare: bool = False,
+) -> TestRunner:
+    return TestRunner(
+        path_of_code,
+        lcases,
+        jobs=options.jobs,
+        time_limit=options.time_limit or limits.time_limit or DEFAULT_TIME_LIMIT,
+        memory_limit=options.memory_limit
+        or limits.memory_limit
+        or DEFAULT_MEMORY_LIMIT,
+        checker=options.checker,
+        warm=options.warm,
+        preload=options.preload,
+        repeat=options.bench,
+        program=program,
+        cds=options.cds,
+        fail_fast=options.fail_fast,
+        problem_url=problem_url if options.history else None,
+        compare=compare,
+        address_limit=options.address_limit,
+    )
+
+
+def watch_test(path_of_code: str, options: TestOptions) -> None:
+    """ソースが保存されるたびにテストを実行し直す.
+
+    テストケースは最初に1度だけ読み込み, コンパイルはソースの内容が変わったときだけ行う.
+    表示には1つのLiveを使い回す.
+    """
+    problem = load_problem(options)
+    if problem is None:
+        return
+    lcases, limits, url = problem
+
+    program: Optional[PreparedProgram] = None
+    digest = None
+    with create_watcher(path_of_code) as watcher, Live() as live:
+        try:
+            for iteration in itertools.count():
+                if iteration:
+                    live.console.clear()
+                with open(path_of_code, 'rb') as file:
+                    current = hashlib.sha256(file.read()).digest()
+                if program is None or current != digest:
+                    if program is not None:
+                        program.cleanup()
+                    program = prepare_program(path_of_code)
+                    digest = current
+
+                test = create_test_runner(
+                    path_of_code, lcases, limits, options, program, url
+                )
+                render_results(test, live, options.compact)
+                live.update(
+                    Group(
+                        live.renderable,
+                        Text(
+                            f'{path_of_code} の保存を待っています (Ctrl+Cで終了)',
+                            style='dim',
+                        ),
+                    )
+                )
+                watcher.wait()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if program is not None:
+                program.cleanup()
+
+
+def run_test(path_of_code: str, options: Optional[TestOptions] = None) -> None:
+    options = options or TestOptions()
+    if options.watch:
+        watch_test(path_of_code, options)
         return
 
-    with open(html_paths[0], 'r') as file:
-        html = file.read()
+    problem = load_problem(options)
+    if problem is None:
+        return
+    lcases, limits, url = problem
+    # プロファイルを取るときは, テストの後にもう1度実行するのでプログラムを残しておく
+    program = prepare_program(path_of_code) if options.profile else None
+    try:
+        test = create_test_runner(path_of_code, lcases, limits, options, program, url)
+        render_results(test, compact=options.compact)
+        if program is not None and program.ok:
+            profile_results(test, program, options)
+    finally:
+        if program is not None:
+            program.cleanup()
+
+    if options.bench_json:
+        export_benchmark(test, options.bench_json)
+        print(f'ベンチマークの結果を保存しました: {options.bench_json}')
+
+
+def test(
+    *args: str,
+    jobs: int = 1,
+    time_limit: Optional[int] = None,
+    memory_limit: Optional[int] = None,
+    abs_tol: Optional[float] = None,
+    rel_tol: Optional[float] = None,
+    judge: Optional[str] = None,
+    warm: bool = False,
+    preload: Union[str, Tuple[str, ...], None] = None,
+    cds: bool = False,
+    bench: int = 1,
+    bench_json: Optional[str] = None,
+    watch: bool = False,
+    compact: bool = False,
+    profile: bool = False,
+    profile_top: int = 10,
+    profile_all: bool = False,
+    fail_fast: bool = False,
+    only: Union[str, int, Tuple[Union[str, int], ...], None] = None,
+    slowest_first: bool = False,
+    format: str = 'rich',
+    history: bool = True,
+    address_limit: bool = True,
+) -> None:
+    # fireは --preload numpy,scipy をタプルとして渡す
+    modules = [preload] if isinstance(preload, str) else list(preload or [])
+    labels = (
+        [str(label) for label in only]
+        if isinstance(only, tuple)
+        else [str(only)]
+        if only is not None
+        else []
+    )
+    checker = CheckerConfig()
+    if judge:
+        checker = CheckerConfig(mode=CheckerMode.SPECIAL, judge=judge)
+    elif abs_tol is not None or rel_tol is not None:
+        checker = CheckerConfig(
+            mode=CheckerMode.FLOAT, abs_tol=abs_tol or 0.0, rel_tol=rel_tol or 0.0
+        )
+    options = TestOptions(
+        jobs=jobs,
+        time_limit=time_limit,
+        memory_limit=memory_limit,
+        checker=checker,
+        warm=warm or bool(modules),
+        preload=modules,
+        cds=cds,
+        bench=bench,
+        bench_json=bench_json,
+        watch=watch,
+        compact=compact,
+        profile=profile or profile_all,
+        profile_top=profile_top,
+        profile_all=profile_all,
+        fail_fast=fail_fast,
+        only=labels,
+        slowest_first=slowest_first,
+        format=format,
+        history=history,
+        address_limit=address_limit,
+    )
 
-    lcases = ProblemHTML(html).load_labeled_testcase()
-    test = TestRunner(path_of_code, lcases)
-    render_results(test)
+    target_filetypes = INTERPRETED_LANGUAGES + COMPILED_LANGUAGES
+    if format not in OUTPUT_FORMATS:
+        print(f'[red][-][/] --format は {", ".join(OUTPUT_FORMATS)} のいずれかです')
+        return
+    if format != 'rich':
+        # CIで使うので対話的には選ばせず, 指定がなければすべてのファイルをテストする
+        paths = find_target_files(
+            *(args or ('*',)),
+            target_filetypes=target_filetypes,
+            report=lambda message: sys.stderr.write(message + '\n'),
+        )
+        machine_readable_test(paths, options)
+        return
 
+    if args and not watch:
+        paths = find_target_files(*args, target_filetypes=target_filetypes)
+        if len(paths) > 1:
+            compare_tests(paths, options)
+        else:
+            list(map(lambda path: run_test(path, options), paths))
+        return
 
-def test(*args: str) -> None:
     execute_files(
         *args,
-        func=run_test,
-        target_filetypes=INTERPRETED_LANGUAGES + COMPILED_LANGUAGES,
+        func=lambda path: run_test(path, options),
+        target_filetypes=target_filetypes,
     )
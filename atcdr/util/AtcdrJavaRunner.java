@@ -0,0 +1,103 @@
+import java.io.BufferedInputStream;
+import java.io.BufferedOutputStream;
+import java.io.BufferedReader;
+import java.io.FileInputStream;
+import java.io.FileOutputStream;
+import java.io.InputStream;
+import java.io.InputStreamReader;
+import java.io.PrintStream;
+import java.lang.reflect.InvocationTargetException;
+import java.lang.reflect.Method;
+import java.net.URL;
+import java.net.URLClassLoader;
+import java.nio.file.Paths;
+import java.security.Permission;
+
+/**
+ * 起動済みのJVMでJavaの解答を繰り返し実行するためのランナー.
+ *
+ * <p>使い方: java -cp RUNNER_DIR AtcdrJavaRunner CLASSPATH MAIN_CLASS
+ *
+ * <p>標準入力から1行に1件 `入力ファイル\t出力ファイル\tエラー出力ファイル` を受け取り, ケースごとに新しい
+ * クラスローダーで解答を読み込み直して(staticな状態を持ち越さないように) mainを呼ぶ. 終わると標準出力に
+ * `終了コード 実行時間(ns)` を1行返す.
+ */
+public class AtcdrJavaRunner {
+    static class ExitException extends SecurityException {
+        final int status;
+
+        ExitException(int status) {
+            this.status = status;
+        }
+    }
+
+    public static void main(String[] args) throws Exception {
+        URL classpath = Paths.get(args[0]).toUri().toURL();
+        String mainClass = args[1];
+        InputStream control = System.in;
+        PrintStream reply = System.out;
+
+        // System.exitをケースの終了として扱う. Security Managerが使えないJDKでは
+        // JVMごと終了するので, 呼び出し側がその終了コードを受け取って再起動する
+        try {
+            System.setSecurityManager(
+                    new SecurityManager() {
+                        @Override
+                        public void checkPermission(Permission perm) {}
+
+                        @Override
+                        public void checkExit(int status) {
+                            throw new ExitException(status);
+                        }
+                    });
+        } catch (UnsupportedOperationException | SecurityException e) {
+            // 何もしない
+        }
+
+        BufferedReader requests = new BufferedReader(new InputStreamReader(control));
+        reply.println("ready");
+        reply.flush();
+
+        String line;
+        while ((line = requests.readLine()) != null) {
+            String[] paths = line.split("\t");
+            InputStream in = new BufferedInputStream(new FileInputStream(paths[0]));
+            // 通常のJVMのSystem.outと同じく, 改行ごとに書き出すPrintStreamにする
+            PrintStream out =
+                    new PrintStream(
+                            new BufferedOutputStream(new FileOutputStream(paths[1]), 8192), true);
+            PrintStream err = new PrintStream(new FileOutputStream(paths[2]), true);
+            System.setIn(in);
+            System.setOut(out);
+            System.setErr(err);
+
+            int status = 0;
+            long start = System.nanoTime();
+            try (URLClassLoader loader =
+                    new URLClassLoader(new URL[] {classpath}, ClassLoader.getPlatformClassLoader())) {
+                Class<?> cls = Class.forName(mainClass, true, loader);
+                Method method = cls.getMethod("main", String[].class);
+                method.invoke(null, (Object) new String[0]);
+            } catch (InvocationTargetException e) {
+                Throwable cause = e.getCause();
+                if (cause instanceof ExitException) {
+                    status = ((ExitException) cause).status;
+                } else {
+                    cause.printStackTrace(err);
+                    status = 1;
+                }
+            } catch (Throwable e) {
+                e.printStackTrace(err);
+                status = 1;
+            }
+            out.flush();
+            long wall = System.nanoTime() - start;
+
+            in.close();
+            out.close();
+            err.close();
+            reply.println(status + " " + wall);
+            reply.flush();
+        }
+    }
+}
@@ -0,0 +1,237 @@
+import os
+import re
+import subprocess
+import tempfile
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from enum import Enum
+from typing import List, NamedTuple, Optional
+
+TOKEN_PATTERN = re.compile(rb'\S+')
+WHITESPACE = b' \t\n\r\x0b\x0c'
+# スペシャルジャッジの制限時間は問題の実行時間制限のこの倍率. 制限がわからなければ既定値
+JUDGE_TIME_LIMIT_FACTOR = 2
+DEFAULT_JUDGE_TIMEOUT = 10.0  # 秒
+
+
+class CheckerMode(Enum):
+    TOKEN = 'token'
+    FLOAT = 'float'
+    SPECIAL = 'special'
+
+
+class Verdict(NamedTuple):
+    ok: bool
+    message: str = ''
+    line: Optional[int] = None  # 最初に食い違った出力の行 (1始まり)
+
+
+def _show(token: bytes) -> str:
+    text = token.decode('utf-8', errors='replace')
+    return text if len(text) <= 40 else text[:40] + '...'
+
+
+class Checker(ABC):
+    """出力を少しずつ受け取って正誤を判定する.
+
+    feedがFalseを返した時点で判定は確定しており, それ以上の出力は読む必要がない.
+    """
+
+    @abstractmethod
+    def feed(self, chunk: bytes) -> bool: ...
+
+    @abstractmethod
+    def finish(self) -> Verdict: ...
+
+    def close(self) -> None:
+        pass
+
+
+class TokenChecker(Checker):
+    """空白区切りのトークンごとに比較し, 最初に食い違った位置(行, 列)を報告する."""
+
+    def __init__(self, expected: str) -> None:
+        self.expected: List[bytes] = TOKEN_PATTERN.findall(expected.encode())
+        self.index = 0
+        self.pending = b''
+        self.line = 1
+        self.col = 1
+        self.verdict: Optional[Verdict] = None
+
+    def match(self, actual: bytes, expected: bytes) -> bool:
+        return actual == expected
+
+    def _advance(self, data: bytes, pos: int, target: int) -> None:
+        newlines = data.count(b'\n', pos, target)
+        if newlines:
+            self.line += newlines
+            self.col = target - data.rindex(b'\n', pos, target)
+        else:
+            self.col += target - pos
+
+    def _check_token(self, token: bytes) -> bool:
+        if self.index >= len(self.expected):
+            self.verdict = Verdict(
+                False,
+                f'{self.line}行{self.col}列目: 出力が多すぎます (余分な出力 {_show(token)})',
+                self.line,
+            )
+            return False
+        expected = self.expected[self.index]
+        self.index += 1
+        if not self.match(token, expected):
+            self.verdict = Verdict(
+                False,
+                f'{self.line}行{self.col}列目: 期待される出力 {_show(expected)}, 実際の出力 {_show(token)}',
+                self.line,
+            )
+            return False
+        return True
+
+    def feed(self, chunk: bytes) -> bool:
+        if self.verdict is not None:
+            return False
+        data = self.pending + chunk
+        self.pending = b''
+
+        # 一致している間はトークンをまとめて比較し, 1トークンずつの処理を省く
+        # 末尾の空白で終わっていないトークンは途中で切れているかもしれない.
+        # 正規表現で探すと空白のない長い出力で2乗の時間がかかるので, 最後の空白を探す
+        cut = max(data.rfind(c) for c in WHITESPACE) + 1
+        tokens = data[:cut].split()
+        if tokens == self.expected[self.index : self.index + len(tokens)]:
+            self.index += len(tokens)
+            self._advance(data, 0, cut)
+            self.pending = data[cut:]
+            return True
+
+        pos = 0
+        for m in TOKEN_PATTERN.finditer(data):
+            self._advance(data, pos, m.start())
+            pos = m.start()
+            if m.end() == len(data):
+                # トークンがチャンクの境界で切れているかもしれないので次回に持ち越す
+                self.pending = data[pos:]
+                return True
+            if not self._check_token(m.group()):
+                return False
+        self._advance(data, pos, len(data))
+        return True
+
+    def finish(self) -> Verdict:
+        if self.verdict is not None:
+            return self.verdict
+        if self.pending and not self._check_token(self.pending):
+            assert self.verdict is not None
+            return self.verdict
+        if self.index < len(self.expected):
+            return Verdict(
+                False,
+                f'{self.line}行{self.col}列目: 出力が足りません (期待される出力 {_show(self.expected[self.index])})',
+                self.line,
+            )
+        return Verdict(True)
+
+
+class FloatChecker(TokenChecker):
+    """数値として読めるトークンは絶対誤差または相対誤差が許容範囲内なら一致とみなす."""
+
+    def __init__(self, expected: str, abs_tol: float, rel_tol: float) -> None:
+        super().__init__(expected)
+        self.abs_tol = abs_tol
+        self.rel_tol = rel_tol
+
+    def match(self, actual: bytes, expected: bytes) -> bool:
+        if actual == expected:
+            return True
+        try:
+            a, e = float(actual), float(expected)
+        except ValueError:
+            return False
+        error = abs(a - e)
+        return error <= self.abs_tol or error <= self.rel_tol * abs(e)
+
+
+class SpecialJudgeChecker(Checker):
+    """ユーザーのジャッジプログラムで判定する.
+
+    出力は一時ファイルに書き出し, `judge 入力 正解 出力` の形で呼び出す. 終了コード0ならAC.
+    timeout秒以内に終わらなければ打ち切り, ジャッジの失敗として不正解にする.
+    """
+
+    def __init__(
+        self,
+        judge: str,
+        input: str,
+        expected: str,
+        timeout: float = DEFAULT_JUDGE_TIMEOUT,
+    ) -> None:
+        self.judge_cmd = (
+            ['python3', judge] if judge.endswith('.py') else [os.path.abspath(judge)]
+        )
+        self.input = input
+        self.expected = expected
+        self.timeout = timeout
+        self.actual = tempfile.NamedTemporaryFile('wb', suffix='.out', delete=False)
+
+    def feed(self, chunk: bytes) -> bool:
+        self.actual.write(chunk)
+        return True
+
+    def finish(self) -> Verdict:
+        self.actual.close()
+        paths = []
+        try:
+            for text, suffix in ((self.input, '.in'), (self.expected, '.ans')):
+                with tempfile.NamedTemporaryFile(
+                    'w', suffix=suffix, delete=False
+                ) as file:
+                    file.write(text)
+                    paths.append(file.name)
+            proc = subprocess.run(
+                self.judge_cmd + paths + [self.actual.name],
+                capture_output=True,
+                text=True,
+                timeout=self.timeout,
+            )
+        except subprocess.TimeoutExpired:
+            return Verdict(
+                False, f'ジャッジが{self.timeout:g}秒以内に終わりませんでした'
+            )
+        finally:
+            for path in paths:
+                os.remove(path)
+        return Verdict(proc.returncode == 0, (proc.stdout + proc.stderr).strip())
+
+    def close(self) -> None:
+        self.actual.close()
+        if os.path.exists(self.actual.name):
+            os.remove(self.actual.name)
+
+
+@dataclass
+class CheckerConfig:
+    mode: CheckerMode = CheckerMode.TOKEN
+    abs_tol: float = 1e-6
+    rel_tol: float = 1e-6
+    judge: Optional[str] = None
+
+    def create(
+        self, input: str, expected: str, time_limit: Optional[int] = None
+    ) -> Checker:
+        match self.mode:
+            case CheckerMode.FLOAT:
+                return FloatChecker(expected, self.abs_tol, self.rel_tol)
+            case CheckerMode.SPECIAL:
+                if self.judge is None:
+                    raise ValueError(
+                        'スペシャルジャッジのプログラムが指定されていません'
+                    )
+                timeout = (
+                    time_limit * JUDGE_TIME_LIMIT_FACTOR / 1000
+                    if time_limit
+                    else DEFAULT_JUDGE_TIMEOUT
+                )
+                return SpecialJudgeChecker(self.judge, input, expected, timeout)
+            case _:
+                return TokenChecker(expected)
@@ -0,0 +1,121 @@
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+from functools import lru_cache
+from typing import List, NamedTuple, Optional
+
+COMPILE_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'atcder', 'compile')
+COMPILE_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+
+class CachedArtifact(NamedTuple):
+    compile_time: Optional[int]
+    stderr: str
+
+
+@lru_cache(maxsize=None)
+def compiler_version(compiler: str) -> str:
+    # javacは -version, それ以外は --version でバージョンを出力する
+    for flag in ('--version', '-version'):
+        try:
+            proc = subprocess.run(
+                [compiler, flag], capture_output=True, text=True, timeout=10
+            )
+        except (OSError, subprocess.TimeoutExpired):
+            continue
+        if proc.returncode == 0:
+            return (proc.stdout + proc.stderr).strip()
+    return ''
+
+
+class CompileCache:
+    """ソースのハッシュ, コンパイルコマンド, コンパイラーのバージョンをキーにした成果物のキャッシュ.
+
+    容量が上限を超えると, 最後に使われた時刻が古いものから削除する.
+    """
+
+    def __init__(
+        self,
+        directory: str = COMPILE_CACHE_DIR,
+        max_bytes: int = COMPILE_CACHE_MAX_BYTES,
+    ) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def key(self, source_path: str, cmd_template: List[str]) -> str:
+        with open(source_path, 'rb') as file:
+            source_hash = hashlib.sha256(file.read()).hexdigest()
+        material = json.dumps(
+            [source_hash, cmd_template, compiler_version(cmd_template[0])]
+        )
+        return hashlib.sha256(material.encode()).hexdigest()
+
+    def _paths(self, key: str) -> tuple[str, str]:
+        base = os.path.join(self.directory, key)
+        return base + '.bin', base + '.json'
+
+    def load(self, key: str, exec_path: str) -> Optional[CachedArtifact]:
+        artifact_path, meta_path = self._paths(key)
+        try:
+            with open(meta_path, 'r') as file:
+                meta = json.load(file)
+            shutil.copy(artifact_path, exec_path)
+            os.utime(meta_path)  # LRUのために最終利用時刻を更新
+        except (OSError, ValueError):
+            return None
+        return CachedArtifact(
+            compile_time=meta.get('compile_time'), stderr=meta.get('stderr', '')
+        )
+
+    def store(
+        self, key: str, exec_path: str, compile_time: Optional[int], stderr: str
+    ) -> None:
+        artifact_path, meta_path = self._paths(key)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            # 書き込み途中のファイルを読まないように, 一時ファイルから置き換える
+            with tempfile.NamedTemporaryFile(dir=self.directory, delete=False) as tmp:
+                tmp_artifact = tmp.name
+            shutil.copy(exec_path, tmp_artifact)
+            os.replace(tmp_artifact, artifact_path)
+            with tempfile.NamedTemporaryFile(
+                'w', dir=self.directory, delete=False
+            ) as meta:
+                json.dump({'compile_time': compile_time, 'stderr': stderr}, meta)
+            os.replace(meta.name, meta_path)
+        except OSError:
+            return
+        self.evict()
+
+    def evict(self) -> None:
+        entries = []
+        total = 0
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        for name in names:
+            if not name.endswith('.json'):
+                continue
+            key = name[: -len('.json')]
+            artifact_path, meta_path = self._paths(key)
+            try:
+                size = os.path.getsize(artifact_path) + os.path.getsize(meta_path)
+                last_used = os.path.getmtime(meta_path)
+            except OSError:
+                continue
+            entries.append((last_used, size, key))
+            total += size
+
+        for _, size, key in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            for path in self._paths(key):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            total -= size
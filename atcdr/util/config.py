@@ -0,0 +1,51 @@
+import json
+import os
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+from atcdr.util.filetype import Lang
+
+CONFIG_FILE = 'atcdr.json'
+
+
+def find_config(directory: str = '.') -> Optional[str]:
+    """カレントディレクトリーから親へ順に atcdr.json を探す."""
+    directory = os.path.abspath(directory)
+    while True:
+        path = os.path.join(directory, CONFIG_FILE)
+        if os.path.isfile(path):
+            return path
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            return None
+        directory = parent
+
+
+@lru_cache(maxsize=None)
+def load_language_config(directory: str = '.') -> Dict[Lang, Dict[str, List[str]]]:
+    """atcdr.json の languages に書かれた言語ごとのコンパイル・実行コマンドを読み込む.
+
+    例: {"languages": {"C++": {"compile": ["g++", "-O0", "{source_path}", "-o", "{exec_path}"]}}}
+    言語名は大文字小文字を区別しない. 書かれていない言語や項目は既定のコマンドを使う.
+    """
+    path = find_config(directory)
+    if path is None:
+        return {}
+    with open(path, 'r') as file:
+        config = json.load(file)
+
+    names = {lang.value.lower(): lang for lang in Lang}
+    languages: Dict[Lang, Dict[str, List[str]]] = {}
+    for name, commands in config.get('languages', {}).items():
+        lang = names.get(name.lower())
+        if lang is None:
+            raise ValueError(f'{path}: 不明な言語です: {name}')
+        for key, cmd in commands.items():
+            if key not in ('compile', 'run'):
+                raise ValueError(f'{path}: {name}.{key} は設定できません')
+            if not isinstance(cmd, list) or not all(isinstance(a, str) for a in cmd):
+                raise ValueError(
+                    f'{path}: {name}.{key} は文字列のリストで指定してください'
+                )
+        languages[lang] = commands
+    return languages
@@ -0,0 +1,89 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional
+
+# ダウンロード先のディレクトリーに置く記録のファイル. 1行に1問の結果をJSONで書く
+JOURNAL_FILE = '.atcdr-download.jsonl'
+
+
+class JournalEntry(NamedTuple):
+    url: str
+    status: str  # 'done' または 'failed'
+    sha256: Optional[str]  # 保存したHTMLのハッシュ
+    paths: List[str]
+    updated_at: float
+
+
+class DownloadJournal:
+    """まとめてダウンロードしたときの問題ごとの結果を記録する.
+
+    1問終わるたびに1行を追記するので, 途中で中断してもそれまでの記録は残る.
+    同じ問題の行は後のものが優先で, 読み込むときに1問1行に詰め直す.
+    再実行したときは保存済みの問題を飛ばす.
+    """
+
+    def __init__(self, base_path: str) -> None:
+        self.path = os.path.join(base_path, JOURNAL_FILE)
+        self.lock = threading.Lock()
+        self.entries: Dict[str, JournalEntry] = {}
+        lines = 0
+        try:
+            with open(self.path, 'r') as file:
+                for line in file:
+                    lines += 1
+                    try:
+                        entry = JournalEntry(**json.loads(line))
+                    except (ValueError, TypeError):
+                        continue  # 書き込み途中で止まった行
+                    self.entries[entry.url] = entry
+        except OSError:
+            return
+        if lines > len(self.entries):
+            self._compact()
+
+    def _compact(self) -> None:
+        directory = os.path.dirname(self.path) or '.'
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            with os.fdopen(fd, 'w') as file:
+                for entry in self.entries.values():
+                    file.write(json.dumps(entry._asdict(), ensure_ascii=False) + '\n')
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass  # 詰め直せなくても追記はできる
+
+    def is_done(self, url: str, directory: str) -> bool:
+        """urlの問題がdirectoryに保存済みで, そのファイルが残っているか."""
+        entry = self.entries.get(url)
+        # 'foo'と'foo/', './foo'などの書き方の違いで別のディレクトリーと見なさない
+        directory = os.path.abspath(directory)
+        return (
+            entry is not None
+            and entry.status == 'done'
+            and bool(entry.paths)
+            and all(
+                os.path.dirname(os.path.abspath(path)) == directory
+                and os.path.isfile(path)
+                for path in entry.paths
+            )
+        )
+
+    def done(self, url: str, paths: List[str]) -> None:
+        with open(paths[0], 'rb') as file:
+            sha256 = hashlib.sha256(file.read()).hexdigest()
+        self._record(JournalEntry(url, 'done', sha256, paths, time.time()))
+
+    def failed(self, url: str) -> None:
+        self._record(JournalEntry(url, 'failed', None, [], time.time()))
+
+    def _record(self, entry: JournalEntry) -> None:
+        line = json.dumps(entry._asdict(), ensure_ascii=False) + '\n'
+        with self.lock:
+            self.entries[entry.url] = entry
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with open(self.path, 'a') as file:
+                file.write(line)
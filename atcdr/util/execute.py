@@ -47,17 +47,33 @@ def execute_files(
             ).ask()
             list(map(func, [target_file]))
     else:
-        target_files = set()
-        for arg in args:
-            if arg == '*':
-                target_files.update(files)
-            elif arg.startswith('*.'):
-                ext = arg[1:]  # ".py" のような拡張子を取得
-                target_files.update(file for file in files if file.endswith(ext))
+        list(map(func, find_target_files(*args, target_filetypes=target_filetypes)))
+
+
+def find_target_files(
+    *args: str,
+    target_filetypes: List[Lang],
+    report: Callable[[str], object] = print,
+) -> List[Filename]:
+    """引数に当てはまるファイルを探す. 見つからない引数はreportで知らせる."""
+    target_extensions = [FILE_EXTENSIONS[lang] for lang in target_filetypes]
+    files = [
+        file
+        for file in os.listdir('.')
+        if os.path.isfile(file) and os.path.splitext(file)[1] in target_extensions
+    ]
+
+    target_files = set()
+    for arg in args:
+        if arg == '*':
+            target_files.update(files)
+        elif arg.startswith('*.'):
+            ext = arg[1:]  # ".py" のような拡張子を取得
+            target_files.update(file for file in files if file.endswith(ext))
+        else:
+            if arg in files:
+                target_files.add(arg)
             else:
-                if arg in files:
-                    target_files.add(arg)
-                else:
-                    print(f'エラー: {arg} は存在しません。')
+                report(f'エラー: {arg} は存在しません。')
 
-        list(map(func, target_files))
+    return sorted(target_files)
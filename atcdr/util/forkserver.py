@@ -0,0 +1,143 @@
+"""Pythonの解答を起動済みのインタープリターからforkして実行するサーバー.
+
+インタープリターの起動と重いモジュール(指定されたものと, 解答がトップレベルでimportするもの)の
+importを1度だけ済ませ, ケースごとにforkした
+子プロセスで解答を実行する. 子の標準入出力はクライアントから受け取ったfdに付け替える.
+
+使い方: python3 -E forkserver.py CONTROL_FD SOURCE [MODULE,MODULE,...]
+CONTROL_FDには準備ができると `ready 失敗したモジュール...` を書き込む. 以後, 1件の実行要求ごとに
+NUL区切りのメッセージ `AS_LIMIT_BYTES ARG...` とfd (応答用ソケット, stdin, stdout, stderr) を受け取り,
+応答用ソケットに `pid` と `wall_ns status utime stime maxrss` を1行ずつ返す.
+"""
+
+import ast
+import builtins
+import os
+import signal
+import socket
+import sys
+import time
+import traceback
+
+
+def run_solution(code, error, source: str, args) -> int:
+    sys.argv = [source, *args]
+    sys.path[0] = os.path.dirname(os.path.abspath(source))
+    if code is None:
+        traceback.print_exception(error)
+        return 1
+    try:
+        exec(
+            code, {'__name__': '__main__', '__file__': source, '__builtins__': builtins}
+        )
+        status = 0
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            status = e.code or 0
+        else:
+            print(e.code, file=sys.stderr)
+            status = 1
+    except BaseException:
+        traceback.print_exc()
+        status = 1
+    for stream in (sys.stdout, sys.stderr):
+        try:
+            stream.flush()
+        except (BrokenPipeError, OSError):
+            pass
+    return status
+
+
+def handle(reply: socket.socket, fds, msg: bytes, code, error, source: str) -> None:
+    # 解答のプロセスを監視するハンドラー. サーバー本体は次の要求をすぐに受け付ける
+    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+    limit, *args = msg.decode().split('\0')
+    start = time.perf_counter_ns()
+    pid = os.fork()
+    if pid == 0:
+        status = 1
+        try:
+            os.setpgid(0, 0)
+            for target, fd in enumerate(fds):
+                os.dup2(fd, target)
+                os.close(fd)
+            reply.close()
+            if int(limit) > 0:
+                import resource
+
+                resource.setrlimit(resource.RLIMIT_AS, (int(limit), int(limit)))
+            status = run_solution(code, error, source, args)
+        finally:
+            os._exit(status)
+
+    for fd in fds:
+        os.close(fd)
+    reply.sendall(f'{pid}\n'.encode())
+    _, status, rusage = os.wait4(pid, 0)
+    wall_ns = time.perf_counter_ns() - start
+    maxrss = rusage.ru_maxrss // 1024 if sys.platform == 'darwin' else rusage.ru_maxrss
+    reply.sendall(
+        f'{wall_ns} {status} {rusage.ru_utime} {rusage.ru_stime} {maxrss}\n'.encode()
+    )
+    reply.close()
+
+
+def main() -> None:
+    control = socket.socket(fileno=int(sys.argv[1]))
+    source = sys.argv[2]
+    modules = [m for m in (sys.argv[3] if len(sys.argv) > 3 else '').split(',') if m]
+
+    code, error = None, None
+    try:
+        with open(source, 'rb') as file:
+            tree = ast.parse(file.read(), source)
+        code = compile(tree, source, 'exec')
+        # 解答がトップレベルでimportしているモジュールも先に読み込んでおく
+        sys.path.insert(0, os.path.dirname(os.path.abspath(source)))
+        implicit = [
+            name
+            for node in tree.body
+            for name in (
+                [alias.name for alias in node.names]
+                if isinstance(node, ast.Import)
+                else [node.module]
+                if isinstance(node, ast.ImportFrom) and node.module and not node.level
+                else []
+            )
+        ]
+    except SyntaxError as e:
+        error = e
+        implicit = []
+
+    failed = []
+    for module in modules:
+        try:
+            __import__(module)
+        except Exception:
+            failed.append(module)
+    for module in implicit:
+        try:
+            __import__(module)
+        except Exception:
+            pass
+
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)  # ハンドラーは自動で回収させる
+    control.sendall(' '.join(['ready', *failed]).encode() + b'\n')
+
+    while True:
+        msg, fds, _, _ = socket.recv_fds(control, 65536, 4)
+        if not msg:
+            break
+        if os.fork() == 0:
+            try:
+                control.close()
+                reply = socket.socket(fileno=fds[0])
+                handle(reply, fds[1:], msg, code, error, source)
+            finally:
+                os._exit(0)
+        for fd in fds:
+            os.close(fd)
+
+
+if __name__ == '__main__':
+    main()
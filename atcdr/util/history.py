@@ -0,0 +1,213 @@
+import os
+import sqlite3
+import time
+from contextlib import closing
+from dataclasses import dataclass, field
+from typing import Dict, List, NamedTuple, Optional
+
+HISTORY_DB = os.path.join(os.path.expanduser('~'), '.cache', 'atcder', 'history.db')
+# 以前の最速よりこの倍率以上, かつこの時間以上遅くなったケースを遅くなったとみなす.
+# 数msのケースは計測のぶれの方が大きいので, 差の下限も設ける
+REGRESSION_RATIO = 1.2
+REGRESSION_MIN_NS = 10_000_000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    problem_url TEXT NOT NULL,
+    source TEXT NOT NULL,
+    source_hash TEXT NOT NULL,
+    lang TEXT NOT NULL,
+    compile_time INTEGER,
+    summary TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    mode TEXT NOT NULL DEFAULT ''
+);
+CREATE TABLE IF NOT EXISTS cases (
+    run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    label TEXT NOT NULL,
+    status TEXT NOT NULL,
+    time_ns INTEGER,
+    memory_kib INTEGER
+);
+CREATE INDEX IF NOT EXISTS runs_problem ON runs(problem_url, lang);
+CREATE INDEX IF NOT EXISTS cases_run ON cases(run_id);
+"""
+
+
+def run_mode(warm: bool, repeat: int, jobs: int, compare: bool = False) -> str:
+    """実行時間の測り方を表す文字列. 同じ測り方の記録どうしだけを比べる.
+
+    fork serverなどで起動を省いた時間, 繰り返した中央値, 並列で互いにCPUを
+    取り合った時間は, 普通に1回ずつ実行した時間とは比べられない.
+    複数のファイルを同時にテストしたときは, 他のファイルの実行とも取り合う.
+    """
+    parts = ['warm' if warm else 'cold']
+    if repeat > 1:
+        parts.append(f'bench{repeat}')
+    if jobs > 1:
+        parts.append(f'jobs{jobs}')
+    if compare:
+        parts.append('compare')
+    return ' '.join(parts)
+
+
+class CaseRecord(NamedTuple):
+    label: str
+    status: str  # ResultStatusの名前 (AC, WAなど)
+    time_ns: Optional[int]
+    memory_kib: Optional[int]
+
+
+@dataclass
+class RunRecord:
+    problem_url: str
+    source: str
+    source_hash: str
+    lang: str
+    compile_time: Optional[int]
+    summary: str
+    mode: str = ''  # run_modeの値. 列を足す前の記録は空
+    cases: List[CaseRecord] = field(default_factory=list)
+    created_at: float = field(default_factory=time.time)
+    id: Optional[int] = None
+
+
+class Regression(NamedTuple):
+    label: str
+    best_ns: int
+    time_ns: int
+
+
+class PerformanceHistory:
+    """テストの結果をSQLiteに記録し, 以前の結果と比べる.
+
+    並列にテストしたときに複数のスレッドから使えるように, 操作ごとに接続を開く.
+    """
+
+    def __init__(self, path: str = HISTORY_DB) -> None:
+        self.path = path
+
+    def connect(self) -> sqlite3.Connection:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA foreign_keys=ON')
+        conn.executescript(SCHEMA)
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(runs)')}
+        if 'mode' not in columns:
+            conn.execute("ALTER TABLE runs ADD COLUMN mode TEXT NOT NULL DEFAULT ''")
+        return conn
+
+    def record(self, run: RunRecord) -> int:
+        with closing(self.connect()) as conn, conn:
+            cursor = conn.execute(
+                'INSERT INTO runs (problem_url, source, source_hash, lang,'
+                ' compile_time, summary, created_at, mode)'
+                ' VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (
+                    run.problem_url,
+                    run.source,
+                    run.source_hash,
+                    run.lang,
+                    run.compile_time,
+                    run.summary,
+                    run.created_at,
+                    run.mode,
+                ),
+            )
+            assert cursor.lastrowid is not None
+            run.id = cursor.lastrowid
+            conn.executemany(
+                'INSERT INTO cases (run_id, label, status, time_ns, memory_kib)'
+                ' VALUES (?, ?, ?, ?, ?)',
+                [(run.id, *case) for case in run.cases],
+            )
+        return run.id
+
+    def best_times(self, problem_url: str, lang: str, mode: str) -> Dict[str, int]:
+        """同じ問題と言語, 同じ測り方でACしたときの, ケースごとの最速の実行時間 (ns)."""
+        with closing(self.connect()) as conn:
+            rows = conn.execute(
+                'SELECT cases.label, MIN(cases.time_ns) FROM cases'
+                ' JOIN runs ON runs.id = cases.run_id'
+                ' WHERE runs.problem_url = ? AND runs.lang = ? AND runs.mode = ?'
+                " AND cases.status = 'AC' AND cases.time_ns IS NOT NULL"
+                ' GROUP BY cases.label',
+                (problem_url, lang, mode),
+            ).fetchall()
+        return {label: best for label, best in rows}
+
+    def runs(
+        self,
+        problem_url: Optional[str] = None,
+        sources: Optional[List[str]] = None,
+        limit: Optional[int] = None,
+    ) -> List[RunRecord]:
+        """記録を古い順に返す. limitを指定すると新しい方からその件数だけを返す."""
+        query = 'SELECT * FROM runs'
+        conditions, params = [], []
+        if problem_url is not None:
+            conditions.append('problem_url = ?')
+            params.append(problem_url)
+        if sources:
+            conditions.append(f'source IN ({", ".join("?" * len(sources))})')
+            params.extend(sources)
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        query += ' ORDER BY id DESC'
+        if limit is not None:
+            query += f' LIMIT {int(limit)}'
+
+        with closing(self.connect()) as conn:
+            conn.row_factory = sqlite3.Row
+            runs = [
+                RunRecord(
+                    problem_url=row['problem_url'],
+                    source=row['source'],
+                    source_hash=row['source_hash'],
+                    lang=row['lang'],
+                    compile_time=row['compile_time'],
+                    summary=row['summary'],
+                    mode=row['mode'],
+                    created_at=row['created_at'],
+                    id=row['id'],
+                )
+                for row in conn.execute(query, params)
+            ]
+            for run in runs:
+                run.cases = [
+                    CaseRecord(*row)
+                    for row in conn.execute(
+                        'SELECT label, status, time_ns, memory_kib FROM cases'
+                        ' WHERE run_id = ? ORDER BY rowid',
+                        (run.id,),
+                    )
+                ]
+        return runs[::-1]
+
+    def problems(self) -> List[sqlite3.Row]:
+        """記録のある問題ごとの実行回数, 最後の実行日時, ACした回数."""
+        with closing(self.connect()) as conn:
+            conn.row_factory = sqlite3.Row
+            return conn.execute(
+                'SELECT problem_url, COUNT(*) AS count, MAX(created_at) AS last_run,'
+                " SUM(summary = 'AC') AS accepted FROM runs"
+                ' GROUP BY problem_url ORDER BY last_run DESC'
+            ).fetchall()
+
+
+def find_regressions(
+    best_times: Dict[str, int], cases: List[CaseRecord]
+) -> List[Regression]:
+    regressions = []
+    for case in cases:
+        best = best_times.get(case.label)
+        if case.status != 'AC' or case.time_ns is None or best is None:
+            continue
+        if (
+            case.time_ns > best * REGRESSION_RATIO
+            and case.time_ns - best > REGRESSION_MIN_NS
+        ):
+            regressions.append(Regression(case.label, best, case.time_ns))
+    return regressions
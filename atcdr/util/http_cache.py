@@ -0,0 +1,238 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from typing import Any, Dict, NamedTuple, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+HTTP_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'atcder', 'http')
+HTTP_CACHE_MAX_BYTES = 256 * 1024 * 1024
+# 本文と一緒に保存するヘッダー. Content-Typeは文字コードの判定に使う
+STORED_HEADERS = ('Content-Type', 'ETag', 'Last-Modified')
+
+
+class CacheEntry(NamedTuple):
+    url: str
+    body: bytes
+    headers: Dict[str, str]
+    stored_at: float  # 最後に取得または再検証した時刻
+
+    @property
+    def etag(self) -> Optional[str]:
+        return CaseInsensitiveDict(self.headers).get('ETag')
+
+    @property
+    def last_modified(self) -> Optional[str]:
+        return CaseInsensitiveDict(self.headers).get('Last-Modified')
+
+    def to_response(self, request: requests.PreparedRequest) -> requests.Response:
+        response = requests.Response()
+        response.status_code = 200
+        response.reason = 'OK'
+        response._content = self.body
+        response.headers = CaseInsensitiveDict(self.headers)
+        response.url = self.url
+        response.request = request
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        return response
+
+
+class HttpCache:
+    """GETのレスポンスの本文をETag, Last-Modifiedと一緒にディスクに保存する.
+
+    ttl秒以内に取得したものはリクエストを送らずに使い, それより古いものは
+    If-None-Match/If-Modified-Sinceを付けて再検証する. offlineなら古さに関わらず
+    保存したものを使い, ないときもリクエストを送らない.
+    容量が上限を超えると, 最後に使われた時刻が古いものから削除する.
+    """
+
+    def __init__(
+        self,
+        directory: str = HTTP_CACHE_DIR,
+        ttl: float = 0,
+        offline: bool = False,
+        max_bytes: int = HTTP_CACHE_MAX_BYTES,
+    ) -> None:
+        self.directory = directory
+        self.ttl = ttl
+        self.offline = offline
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.total: Optional[int] = None  # 合計サイズ. 最初に保存するときに数える
+
+    def _paths(self, url: str) -> tuple[str, str]:
+        base = os.path.join(self.directory, hashlib.sha256(url.encode()).hexdigest())
+        return base + '.body', base + '.json'
+
+    def load(self, url: str) -> Optional[CacheEntry]:
+        body_path, meta_path = self._paths(url)
+        try:
+            with open(meta_path, 'r') as file:
+                meta = json.load(file)
+            with open(body_path, 'rb') as file:
+                body = file.read()
+            os.utime(meta_path)  # LRUのために最終利用時刻を更新
+        except (OSError, ValueError):
+            return None
+        return CacheEntry(url, body, meta['headers'], meta['stored_at'])
+
+    def is_fresh(self, entry: CacheEntry) -> bool:
+        return self.offline or time.time() - entry.stored_at < self.ttl
+
+    def has_fresh(self, url: str) -> bool:
+        """リクエストを送らずに応答できるか."""
+        entry = self.load(url)
+        return entry is not None and self.is_fresh(entry)
+
+    def _write(self, path: str, data: Any, mode: str) -> int:
+        with tempfile.NamedTemporaryFile(mode, dir=self.directory, delete=False) as tmp:
+            if mode == 'w':
+                json.dump(data, tmp)
+            else:
+                tmp.write(data)
+        os.replace(tmp.name, path)
+        return os.path.getsize(path)
+
+    def store(self, url: str, body: bytes, headers: Dict[str, str]) -> CacheEntry:
+        entry = CacheEntry(url, body, headers, time.time())
+        body_path, meta_path = self._paths(url)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            previous = sum(
+                os.path.getsize(path)
+                for path in (body_path, meta_path)
+                if os.path.exists(path)
+            )
+            # 書き込み途中のファイルを読まないように, 一時ファイルから置き換える
+            size = self._write(body_path, body, 'wb')
+            size += self._write(
+                meta_path, {'headers': headers, 'stored_at': entry.stored_at}, 'w'
+            )
+        except OSError:
+            return entry
+        with self.lock:
+            if self.total is None:
+                self.total = self._measure()
+            else:
+                self.total += size - previous
+            if self.total > self.max_bytes:
+                self.evict()
+        return entry
+
+    def revalidated(self, entry: CacheEntry, headers: Dict[str, str]) -> CacheEntry:
+        """304を受けたので, 取得した時刻と新しい検証子だけを更新する."""
+        return self.store(entry.url, entry.body, {**entry.headers, **headers})
+
+    def _entries(self) -> list:
+        entries = []
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return []
+        for name in names:
+            if not name.endswith('.json'):
+                continue
+            base = os.path.join(self.directory, name[: -len('.json')])
+            try:
+                size = os.path.getsize(base + '.body') + os.path.getsize(base + '.json')
+                last_used = os.path.getmtime(base + '.json')
+            except OSError:
+                continue
+            entries.append((last_used, size, base))
+        return entries
+
+    def _measure(self) -> int:
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self) -> None:
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, base in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            for suffix in ('.body', '.json'):
+                try:
+                    os.remove(base + suffix)
+                except OSError:
+                    pass
+            total -= size
+        self.total = total
+
+
+class OfflineCacheMiss(requests.ConnectionError):
+    """オフラインモードでキャッシュにないURLを要求した."""
+
+
+def _stored_headers(response: requests.Response) -> Dict[str, str]:
+    return {
+        name: response.headers[name]
+        for name in STORED_HEADERS
+        if name in response.headers
+    }
+
+
+class CachingAdapter(HTTPAdapter):
+    """HttpCacheを通してGETを送るトランスポートアダプター.
+
+    Sessionにmountすると, 呼び出し側を変えずにキャッシュが効く.
+    """
+
+    def __init__(self, cache: HttpCache, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.cache = cache
+
+    def send(
+        self,
+        request: requests.PreparedRequest,
+        stream: bool = False,
+        timeout: Any = None,
+        verify: Any = True,
+        cert: Any = None,
+        proxies: Any = None,
+    ) -> requests.Response:
+        kwargs = dict(
+            stream=stream, timeout=timeout, verify=verify, cert=cert, proxies=proxies
+        )
+        if request.method != 'GET' or request.url is None:
+            return super().send(request, **kwargs)
+
+        entry = self.cache.load(request.url)
+        if entry is not None and self.cache.is_fresh(entry):
+            return entry.to_response(request)
+        if self.cache.offline:
+            raise OfflineCacheMiss(
+                f'オフラインモードですが, キャッシュがありません: {request.url}',
+                request=request,
+            )
+
+        if entry is not None:
+            if entry.etag:
+                request.headers['If-None-Match'] = entry.etag
+            if entry.last_modified:
+                request.headers['If-Modified-Since'] = entry.last_modified
+        response = super().send(request, **kwargs)
+
+        if response.status_code == 304 and entry is not None:
+            response.close()
+            entry = self.cache.revalidated(entry, _stored_headers(response))
+            return entry.to_response(request)
+        if response.status_code == 200:
+            self.cache.store(request.url, response.content, _stored_headers(response))
+        return response
+
+
+def install_cache(
+    session: requests.Session, cache: Optional[HttpCache] = None, jobs: int = 1
+) -> requests.Session:
+    """sessionにCachingAdapterをmountする. 同時に使う接続の数だけプールに残す."""
+    adapter = CachingAdapter(
+        cache or HttpCache(), pool_connections=1, pool_maxsize=max(1, jobs)
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
@@ -0,0 +1,313 @@
+import hashlib
+import os
+import select
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import zipfile
+from typing import Callable, List, Optional
+
+from atcdr.util.compile_cache import compiler_version
+from atcdr.util.process import Cancellation, ProcessResult, watch_cancel
+
+JAVA_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'atcder', 'java')
+RUNNER_CLASS = 'AtcdrJavaRunner'
+RUNNER_SOURCE = os.path.join(os.path.dirname(__file__), RUNNER_CLASS + '.java')
+CDS_ARCHIVE = 'app.jsa'
+CDS_TIMEOUT = 60
+
+
+def main_class_name(classpath: str, source_path: str) -> str:
+    """AtCoderの提出はMainクラスなので, Main.classがあればそれを, なければファイル名を使う."""
+    if os.path.exists(os.path.join(classpath, 'Main.class')):
+        return 'Main'
+    return os.path.splitext(os.path.basename(source_path))[0]
+
+
+def javac_for(java: str) -> str:
+    # java と同じディレクトリーの javac を使い, JDKの版を揃える
+    directory = os.path.dirname(java)
+    return os.path.join(directory, 'javac') if directory else 'javac'
+
+
+def runner_classpath(javac: str = 'javac') -> str:
+    """AtcdrJavaRunner.java をコンパイルしたディレクトリーを返す.
+
+    ランナーのソースとjavacのバージョンごとに1度だけコンパイルする.
+    """
+    with open(RUNNER_SOURCE, 'rb') as file:
+        material = file.read() + compiler_version(javac).encode()
+    directory = os.path.join(JAVA_CACHE_DIR, hashlib.sha256(material).hexdigest()[:16])
+    if os.path.exists(os.path.join(directory, RUNNER_CLASS + '.class')):
+        return directory
+
+    os.makedirs(JAVA_CACHE_DIR, exist_ok=True)
+    work = tempfile.mkdtemp(dir=JAVA_CACHE_DIR)
+    try:
+        proc = subprocess.run(
+            [javac, '-encoding', 'UTF-8', '-d', work, RUNNER_SOURCE],
+            capture_output=True,
+            text=True,
+        )
+        if proc.returncode != 0:
+            raise RuntimeError(
+                f'Javaのランナーのコンパイルに失敗しました\n{proc.stderr}'
+            )
+        try:
+            # 他のプロセスが先に作っていれば, そちらを使う
+            os.rename(work, directory)
+        except OSError:
+            pass
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+    return directory
+
+
+def jvm_options(cmd: List[str]) -> List[str]:
+    """java -cp DIR Main のような実行コマンドから, クラスパスとクラス名以外のオプションを取り出す.
+
+    CDSのアーカイブはクラスパスごとに作るので引き継がない.
+    """
+    options = []
+    skip = False
+    for arg in cmd[1:-1]:
+        if skip:
+            skip = False
+            continue
+        if arg in ('-cp', '-classpath', '--class-path'):
+            skip = True
+            continue
+        if arg.startswith('-XX:SharedArchiveFile='):
+            continue
+        options.append(arg)
+    return options
+
+
+def with_cds_archive(cmd: List[str], classpath: str, input: bytes) -> List[str]:
+    """解答のAppCDSアーカイブを作り, それを使う実行コマンドを返す.
+
+    CDSはディレクトリーから読んだクラスをアーカイブしないので, クラスをjarにまとめてから
+    1度実行して, 読み込まれたクラスを -XX:ArchiveClassesAtExit で書き出す.
+    作れなかったときは元のコマンドを返す.
+    """
+    jar_path = os.path.join(classpath, 'app.jar')
+    with zipfile.ZipFile(jar_path, 'w') as jar:
+        for root, _, files in os.walk(classpath):
+            for name in files:
+                if name.endswith('.class'):
+                    path = os.path.join(root, name)
+                    jar.write(path, os.path.relpath(path, classpath))
+    cmd = [jar_path if arg == classpath else arg for arg in cmd]
+
+    archive = os.path.join(classpath, CDS_ARCHIVE)
+    try:
+        subprocess.run(
+            [cmd[0], f'-XX:ArchiveClassesAtExit={archive}', *cmd[1:]],
+            input=input,
+            capture_output=True,
+            timeout=CDS_TIMEOUT,
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return cmd
+    if not os.path.exists(archive):
+        return cmd
+    return [cmd[0], f'-XX:SharedArchiveFile={archive}', *cmd[1:]]
+
+
+class JvmServer:
+    """Javaの解答を起動済みのJVMで実行する.
+
+    ケースごとに新しいクラスローダーで読み込み直すので, staticな状態は持ち越さない.
+    JVMの起動にかかった時間はstartup_time_nsに記録するので, 起動込みの実行時間を見積もれる.
+    JVMは1つなので, ケースは1つずつ順に実行する. 時間切れやSystem.exitでJVMが
+    終わったときは, 次のケースの前に起動し直す.
+    """
+
+    def __init__(
+        self,
+        java: str,
+        classpath: str,
+        main_class: str,
+        options: Optional[List[str]] = None,
+        cds: bool = False,
+    ) -> None:
+        self.java = java
+        self.classpath = classpath
+        self.main_class = main_class
+        self.options = options or []
+        self.cds = cds
+        self.startup_time_ns = 0
+        self.proc: Optional[subprocess.Popen] = None
+        self.work: Optional[str] = None
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def available() -> bool:
+        return os.name == 'posix'
+
+    def _command(self, *options: str) -> List[str]:
+        return [
+            self.java,
+            *self.options,
+            *options,
+            '-cp',
+            self.runner,
+            RUNNER_CLASS,
+            self.classpath,
+            self.main_class,
+        ]
+
+    def start(self) -> None:
+        """JVMを起動する. 起動できなければ後片付けをしてから送出する."""
+        try:
+            self._start()
+        except BaseException:
+            self.close()
+            raise
+
+    def _start(self) -> None:
+        self.runner = runner_classpath(javac_for(self.java))
+        self.work = tempfile.mkdtemp(prefix='atcdr-jvm-')
+        options = []
+        if self.cds:
+            # 何も実行せずに終わらせて, ランナーと標準ライブラリーのクラスをアーカイブする
+            archive = os.path.join(self.work, CDS_ARCHIVE)
+            try:
+                subprocess.run(
+                    self._command(f'-XX:ArchiveClassesAtExit={archive}'),
+                    input=b'',
+                    capture_output=True,
+                    timeout=CDS_TIMEOUT,
+                )
+            except (OSError, subprocess.TimeoutExpired):
+                pass
+            if os.path.exists(archive):
+                options.append(f'-XX:SharedArchiveFile={archive}')
+        self.server_options = options
+        self._launch()
+
+    def _launch(self) -> None:
+        start = time.perf_counter_ns()
+        self.proc = subprocess.Popen(
+            self._command(*self.server_options),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        ready = self._read_reply()
+        startup_time_ns = time.perf_counter_ns() - start
+        if ready != 'ready':
+            self._stop()
+            raise RuntimeError('JVMの起動に失敗しました')
+        # 起動し直したときの時間は, 初回の見積もりを上書きしない
+        self.startup_time_ns = self.startup_time_ns or startup_time_ns
+
+    def _read_reply(self, timeout: Optional[float] = None) -> Optional[str]:
+        """ランナーの返答を1行読む. 時間切れならNone, JVMが終了していれば空文字列を返す."""
+        assert self.proc and self.proc.stdout
+        fd = self.proc.stdout.fileno()
+        # 返答は依頼1件につき1行なので, 次の行まで読み込んでしまうことはない
+        data = b''
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not data.endswith(b'\n'):
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return None
+            if not select.select([fd], [], [], remaining)[0]:
+                return None
+            chunk = os.read(fd, 4096)
+            if not chunk:
+                break
+            data += chunk
+        return data.decode().strip()
+
+    def _stop(self) -> int:
+        assert self.proc
+        self.proc.kill()
+        returncode = self.proc.wait()
+        for stream in (self.proc.stdin, self.proc.stdout):
+            if stream:
+                stream.close()
+        self.proc = None
+        return returncode
+
+    def close(self) -> None:
+        with self.lock:
+            if self.proc is not None:
+                assert self.proc.stdin
+                self.proc.stdin.close()
+                try:
+                    self.proc.wait(timeout=5)
+                except subprocess.TimeoutExpired:
+                    pass
+                self._stop()
+            if self.work is not None:
+                shutil.rmtree(self.work, ignore_errors=True)
+
+    def __enter__(self) -> 'JvmServer':
+        self.start()
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    def run(
+        self,
+        input: bytes,
+        timeout: Optional[float] = None,
+        address_space_limit: Optional[int] = None,
+        on_stdout: Optional[Callable[[bytes], bool]] = None,
+        cancel: Optional[Cancellation] = None,
+    ) -> ProcessResult:
+        # 仮想メモリの上限はJVM全体にかかるので, address_space_limitは使わない
+        with self.lock, tempfile.TemporaryDirectory(dir=self.work) as case_dir:
+            paths = [os.path.join(case_dir, name) for name in ('in', 'out', 'err')]
+            # JVMが途中で終了しても読めるように, 出力先も先に作っておく
+            for path, data in zip(paths, (input, b'', b'')):
+                with open(path, 'wb') as file:
+                    file.write(data)
+            if self.proc is None:
+                self._launch()
+            proc = self.proc
+            assert proc and proc.stdin
+
+            start = time.perf_counter_ns()
+            try:
+                with watch_cancel(cancel, proc.kill):
+                    proc.stdin.write(('\t'.join(paths) + '\n').encode())
+                    proc.stdin.flush()
+                    reply = self._read_reply(timeout)
+            except BrokenPipeError:
+                reply = ''
+            wall_time_ns = time.perf_counter_ns() - start
+
+            timed_out = reply is None
+            if timed_out:
+                returncode = self._stop()
+            elif not reply:
+                # Security Managerが使えないJDKでSystem.exitが呼ばれた
+                returncode = self._stop()
+            else:
+                status, reported_ns = reply.split()
+                returncode, wall_time_ns = int(status), int(reported_ns)
+
+            result = ProcessResult(
+                returncode=returncode,
+                stdout=b'',
+                stderr=b'',
+                wall_time_ns=wall_time_ns,
+                timed_out=timed_out,
+            )
+            with open(paths[1], 'rb') as file:
+                if on_stdout:
+                    for chunk in iter(lambda: file.read(65536), b''):
+                        if not on_stdout(chunk):
+                            result.stopped = True
+                            break
+                else:
+                    result.stdout = file.read()
+            with open(paths[2], 'rb') as file:
+                result.stderr = file.read()
+        return result
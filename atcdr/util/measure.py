@@ -0,0 +1,52 @@
+"""子プロセスの資源使用量を計測するための小さな実行ラッパー.
+
+atcdr本体のプロセスから直接execすると, execの直前のメモリ空間(=atcdr本体)の
+最大RSSが子プロセスのru_maxrssに引き継がれてしまう. 標準ライブラリしか読み込まない
+このスクリプトを間に挟み, ここからforkした子でexecすることで正しい値を得る.
+
+使い方: python -S -E measure.py REPORT_FD AS_LIMIT_BYTES CMD...
+終了後, REPORT_FDに `wall_ns status utime stime maxrss` を書き込む.
+ラッパー自身はSIGTERMを無視するので, プロセスグループにSIGTERMを送ると
+解答だけが終了し, それまでの使用量が報告される.
+"""
+
+import os
+import signal
+import sys
+import time
+
+
+def main() -> None:
+    report_fd = int(sys.argv[1])
+    address_space_limit = int(sys.argv[2])
+    cmd = sys.argv[3:]
+
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    start = time.perf_counter_ns()
+    pid = os.fork()
+    if pid == 0:
+        os.close(report_fd)
+        try:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            if address_space_limit > 0:
+                import resource
+
+                resource.setrlimit(
+                    resource.RLIMIT_AS, (address_space_limit, address_space_limit)
+                )
+            os.execvp(cmd[0], cmd)
+        except BaseException:
+            os._exit(127)
+
+    _, status, rusage = os.wait4(pid, 0)
+    wall_ns = time.perf_counter_ns() - start
+    maxrss = rusage.ru_maxrss // 1024 if sys.platform == 'darwin' else rusage.ru_maxrss
+    os.write(
+        report_fd,
+        f'{wall_ns} {status} {rusage.ru_utime} {rusage.ru_stime} {maxrss}\n'.encode(),
+    )
+    os.close(report_fd)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,13 @@
 import re
+from datetime import datetime
 from typing import Dict, Iterator, List, Optional
 
 from bs4 import BeautifulSoup as bs
 from bs4 import Tag
 from markdownify import MarkdownConverter
 
+from atcdr.util.testcase_cache import ProblemLimits
+
 
 class HTML:
     def __init__(self, html: str) -> None:
@@ -67,6 +70,16 @@ class ProblemForm(Tag):
         return {option.text.strip(): int(option['value']) for option in options}
 
 
+MEMORY_UNITS_IN_MIB = {
+    'KB': 1 / 1024,
+    'KiB': 1 / 1024,
+    'MB': 1,
+    'MiB': 1,
+    'GB': 1024,
+    'GiB': 1024,
+}
+
+
 class ProblemHTML(HTML):
     def repair_me(self) -> None:
         html = self.html.replace('//img.atcoder.jp', 'https://img.atcoder.jp')
@@ -142,6 +155,27 @@ class ProblemHTML(HTML):
 
         return ltest_cases
 
+    def load_limits(self) -> ProblemLimits:
+        # 例: Time Limit: 2 sec / Memory Limit: 1024 MiB, 実行時間制限: 2 sec / メモリ制限: 1024 MB
+        text = self.soup.get_text(' ')
+        time_match = re.search(
+            r'(?:Time Limit|実行時間制限)\s*:\s*([\d.]+)\s*sec', text
+        )
+        memory_match = re.search(
+            r'(?:Memory Limit|メモリ制限)\s*:\s*([\d.]+)\s*(KiB|KB|MiB|MB|GiB|GB)',
+            text,
+        )
+        time_limit = int(float(time_match.group(1)) * 1000) if time_match else None
+        memory_limit = (
+            int(
+                float(memory_match.group(1))
+                * MEMORY_UNITS_IN_MIB[memory_match.group(2)]
+            )
+            if memory_match
+            else None
+        )
+        return ProblemLimits(time_limit=time_limit, memory_limit=memory_limit)
+
     @property
     def form(self) -> ProblemForm:
         form = self.soup.find('form', class_='form-code-submit')
@@ -198,6 +232,19 @@ def get_problem_urls_from_tasks(html_content: str) -> list[tuple[str, str]]:
     return links
 
 
+def get_contest_end_time(html_content: str) -> Optional[float]:
+    """コンテストのページのヘッダーにある終了時刻 (UNIX時間). 見つからなければNone."""
+    soup = bs(html_content, 'html.parser')
+    times = soup.select('small.contest-duration time')
+    if not times:
+        return None
+    try:
+        end = datetime.strptime(times[-1].text.strip(), '%Y-%m-%d %H:%M:%S%z')
+    except ValueError:
+        return None
+    return end.timestamp()
+
+
 def get_submission_id(html_content: str) -> Optional[int]:
     soup = bs(html_content, 'html.parser')
     first_tr = soup.select_one('tbody > tr')
@@ -0,0 +1,65 @@
+import hashlib
+import json
+import os
+import subprocess
+import tempfile
+from typing import List
+
+from atcdr.util.compile_cache import compiler_version
+
+PCH_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'atcder', 'pch')
+PCH_HEADER = 'bits/stdc++.h'
+
+
+def is_gcc_cpp(cmd_template: List[str]) -> bool:
+    return os.path.basename(cmd_template[0]).startswith('g++')
+
+
+def pch_flags(cmd_template: List[str]) -> List[str]:
+    """コンパイルのコマンドと同じフラグで作ったbits/stdc++.hのプリコンパイル済みヘッダーを用意する.
+
+    GCCはインクルードパスの各ディレクトリーで `ヘッダー名.gch` を先に探し, フラグが
+    合っていればそれを使う. そのディレクトリーを -I で渡すための引数を返す.
+    コンパイラーのバージョンとフラグごとに1度だけ作り, 失敗したら何も渡さない.
+    """
+    if not is_gcc_cpp(cmd_template):
+        return []
+    compiler = cmd_template[0]
+    # ソースと出力先を除いたフラグ. -o の次は出力先なので一緒に除く
+    flags = []
+    skip = False
+    for arg in cmd_template[1:]:
+        if skip or '{source_path}' in arg or '{exec_path}' in arg:
+            skip = False
+            continue
+        if arg == '-o':
+            skip = True
+            continue
+        flags.append(arg)
+
+    material = json.dumps([compiler_version(compiler), compiler, flags])
+    directory = os.path.join(
+        PCH_CACHE_DIR, hashlib.sha256(material.encode()).hexdigest()[:16]
+    )
+    gch_path = os.path.join(directory, PCH_HEADER + '.gch')
+    if os.path.exists(gch_path):
+        return ['-I', directory]
+
+    os.makedirs(os.path.dirname(gch_path), exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=directory) as work:
+        header = os.path.join(work, 'pch.h')
+        with open(header, 'w') as file:
+            file.write(f'#include <{PCH_HEADER}>\n')
+        tmp_gch = os.path.join(work, 'stdc++.h.gch')
+        try:
+            proc = subprocess.run(
+                [compiler, *flags, '-x', 'c++-header', header, '-o', tmp_gch],
+                capture_output=True,
+            )
+        except OSError:
+            return []
+        if proc.returncode != 0:
+            return []
+        # 他のプロセスが同時に作っていても, 置き換えは不可分なので壊れたファイルは見えない
+        os.replace(tmp_gch, gch_path)
+    return ['-I', directory]
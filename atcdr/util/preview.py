@@ -0,0 +1,202 @@
+import atexit
+import hashlib
+import io
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+from typing import IO, List, Optional, Set
+
+# 表示する行数と1行の長さの上限. これを超える部分は一時ファイルに書き出して省略する
+PREVIEW_HEAD_LINES = 10
+PREVIEW_TAIL_LINES = 10
+PREVIEW_CONTEXT_LINES = 5  # 食い違った行の前後に表示する行数
+PREVIEW_LINE_WIDTH = 200
+SPILL_DIR = os.path.join(tempfile.gettempdir(), 'atcdr')
+SPILL_PREFIXES = ('case-', 'output-')
+# 表示したパスは終了後に開けるように残し, 次に終了するときにこれより古ければ消す
+SPILL_KEEP_SECONDS = 24 * 60 * 60
+
+_spill_lock = threading.Lock()
+_unshown: Set[str] = set()  # このプロセスで書き出し, まだパスを表示していないファイル
+
+
+def _show_line(line: bytes) -> str:
+    line = line.rstrip(b'\r\n')
+    if len(line) <= PREVIEW_LINE_WIDTH:
+        return line.decode('utf-8', errors='replace')
+    rest = len(line) - PREVIEW_LINE_WIDTH
+    head = line[:PREVIEW_LINE_WIDTH].decode('utf-8', errors='ignore')
+    return f'{head}... (+{rest}バイト)'
+
+
+def _omitted(count: int) -> str:
+    return f'... ({count}行省略) ...'
+
+
+def build_preview(stream: IO[bytes], focus_line: Optional[int] = None) -> str:
+    """テキストを先頭と末尾, またはfocus_line (1始まり) の前後だけに切り詰める.
+
+    全体を読むのは1度だけで, 保持するのは表示する行だけなので, 巨大な出力でも
+    メモリを使わない. 切り詰めなかった場合は元のテキストと同じものを返す.
+    """
+    head: List[str] = []
+    tail: deque = deque(maxlen=PREVIEW_TAIL_LINES)
+    window: List[str] = []
+    total = 0
+    size = 0
+    clipped = False
+
+    if focus_line is not None:
+        first = max(1, focus_line - PREVIEW_CONTEXT_LINES)
+        last = focus_line + PREVIEW_CONTEXT_LINES
+    for line in stream:
+        total += 1
+        size += len(line)
+        clipped = clipped or len(line.rstrip(b'\r\n')) > PREVIEW_LINE_WIDTH
+        if focus_line is not None:
+            if first <= total <= last:
+                window.append(_show_line(line))
+        elif len(head) < PREVIEW_HEAD_LINES:
+            head.append(_show_line(line))
+        else:
+            tail.append(_show_line(line))
+
+    if focus_line is not None and total > PREVIEW_HEAD_LINES + PREVIEW_TAIL_LINES:
+        lines = window
+        if first > 1:
+            lines.insert(0, _omitted(first - 1))
+        if last < total:
+            lines.append(_omitted(total - last))
+    elif total > PREVIEW_HEAD_LINES + PREVIEW_TAIL_LINES:
+        omitted = total - len(head) - len(tail)
+        lines = head + [_omitted(omitted)] + list(tail)
+    elif not clipped:
+        stream.seek(0)
+        return stream.read().decode('utf-8', errors='replace')
+    else:
+        # 行数は少ないが1行が長いので, 全行を切り詰めて表示する
+        stream.seek(0)
+        lines = [_show_line(line) for line in stream]
+
+    lines.append(f'(全体 {total}行 / {size}バイト)')
+    return '\n'.join(lines)
+
+
+def needs_preview(text: str) -> bool:
+    lines = text.count('\n') + 1
+    return lines > PREVIEW_HEAD_LINES + PREVIEW_TAIL_LINES or any(
+        len(line) > PREVIEW_LINE_WIDTH for line in text.splitlines()
+    )
+
+
+def preview_text(text: str, focus_line: Optional[int] = None) -> str:
+    if not needs_preview(text):
+        return text
+    return build_preview(io.BytesIO(text.encode()), focus_line)
+
+
+def _track(path: str) -> None:
+    with _spill_lock:
+        _unshown.add(path)
+
+
+def mark_shown(path: str) -> None:
+    """パスを表示したので, 終了時に消さずに残す."""
+    with _spill_lock:
+        _unshown.discard(path)
+
+
+def discard(path: Optional[str]) -> None:
+    """表示しないことが決まった一時ファイルをすぐに消す."""
+    if path is None:
+        return
+    with _spill_lock:
+        _unshown.discard(path)
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+@atexit.register
+def _cleanup_spilled() -> None:
+    with _spill_lock:
+        paths = list(_unshown)
+        _unshown.clear()
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    # 以前の実行で表示したファイルも, 古くなったものは消す
+    try:
+        names = os.listdir(SPILL_DIR)
+    except OSError:
+        return
+    deadline = time.time() - SPILL_KEEP_SECONDS
+    for name in names:
+        if not name.startswith(SPILL_PREFIXES):
+            continue
+        path = os.path.join(SPILL_DIR, name)
+        try:
+            if os.path.getmtime(path) < deadline:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+def spill(data: bytes, suffix: str) -> str:
+    """全文を一時ファイルに書き出してそのパスを返す. 表示したらmark_shownを呼ぶ."""
+    os.makedirs(SPILL_DIR, exist_ok=True)
+    fd, path = tempfile.mkstemp(prefix='case-', suffix=suffix, dir=SPILL_DIR)
+    with os.fdopen(fd, 'wb') as file:
+        file.write(data)
+    _track(path)
+    return path
+
+
+class OutputCapture:
+    """子プロセスの出力を受け取り, 上限を超えたら一時ファイルに書き出す.
+
+    メモリに保持するのは上限までで, 表示にはbuild_previewで切り詰めたものを使う.
+    出力全体のSHA-256も受け取りながら計算する. 切り詰めて表示するときは必ず全文を
+    ファイルに書き出す. 書き出したファイルは表示しなければ終了時に消える.
+    """
+
+    def __init__(self, limit: int) -> None:
+        self.limit = limit
+        self.buffer = bytearray()
+        self.file: Optional[IO[bytes]] = None
+        self.path: Optional[str] = None
+        self.hash = hashlib.sha256()
+
+    def write(self, chunk: bytes) -> None:
+        self.hash.update(chunk)
+        if self.file is None and len(self.buffer) + len(chunk) <= self.limit:
+            self.buffer.extend(chunk)
+            return
+        if self.file is None:
+            os.makedirs(SPILL_DIR, exist_ok=True)
+            fd, self.path = tempfile.mkstemp(
+                prefix='output-', suffix='.out', dir=SPILL_DIR
+            )
+            _track(self.path)
+            self.file = os.fdopen(fd, 'wb')
+            self.file.write(self.buffer)
+            self.buffer = bytearray()
+        self.file.write(chunk)
+
+    def preview(self, focus_line: Optional[int] = None) -> str:
+        if self.file is None:
+            text = self.buffer.decode('utf-8', errors='replace')
+            shown = preview_text(text, focus_line)
+            # 上限より小さくても切り詰めて表示するなら, 全文を読めるように書き出す
+            if shown != text and self.path is None:
+                self.path = spill(bytes(self.buffer), '.out')
+            return shown
+        assert self.path is not None
+        self.file.close()
+        with open(self.path, 'rb') as file:
+            return build_preview(file, focus_line)
@@ -2,7 +2,9 @@ from typing import List, Optional
 
 import requests
 
-from atcdr.util.parse import get_problem_urls_from_tasks
+from atcdr.util.http_cache import OfflineCacheMiss, install_cache
+from atcdr.util.parse import get_contest_end_time, get_problem_urls_from_tasks
+from atcdr.util.task_index import TaskIndex
 
 
 class Contest:
@@ -34,17 +36,32 @@ class Contest:
     def __repr__(self) -> str:
         return f'Contest(name={self._name}, number={self._number})'
 
-    def problems(self, session: Optional[requests.Session] = None) -> List['Problem']:
-        session = session or requests.Session()
-        response = session.get(self.url)
-
-        if response.status_code != 200:
-            return []
-
-        return [
-            Problem(self, label=label, url=url)
-            for label, url in get_problem_urls_from_tasks(response.text)
-        ]
+    def problems(
+        self, session: Optional[requests.Session] = None, refresh: bool = False
+    ) -> List['Problem']:
+        """問題の一覧. 索引に有効なものがあれば, refreshでなければ通信しない.
+
+        オフラインでページのキャッシュもなければ, 期限の切れた索引を使う.
+        それもなければOfflineCacheMissを送出する.
+        """
+        index = TaskIndex()
+        tasks = None if refresh else index.load(self.url)
+        if tasks is None:
+            session = session or install_cache(requests.Session())
+            try:
+                response = session.get(self.url)
+            except OfflineCacheMiss:
+                tasks = index.load(self.url, allow_expired=True)
+                if tasks is None:
+                    raise
+            else:
+                if response.status_code != 200:
+                    return []
+
+                tasks = get_problem_urls_from_tasks(response.text)
+                index.store(self.url, tasks, get_contest_end_time(response.text))
+
+        return [Problem(self, label=label, url=url) for label, url in tasks]
 
 
 class Diff(str):
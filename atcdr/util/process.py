@@ -0,0 +1,441 @@
+import functools
+import os
+import select
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass
+from typing import IO, Callable, ContextManager, Iterator, List, Optional, Sequence, Set
+
+from atcdr.util import forkserver
+from atcdr.util import measure as measure_wrapper
+
+# rusageを取るにはfork/wait4が必要. 使えない環境では計測せずに実行する
+CAN_MEASURE = hasattr(os, 'fork') and hasattr(os, 'wait4')
+# forkserver.pyが使う機能. 解答を実行するPythonがこれを持っていればfork serverを使える
+FORKSERVER_PROBE = 'import os, socket; os.fork; os.wait4; socket.recv_fds'
+FORKSERVER_PROBE_TIMEOUT = 10.0
+
+
+@dataclass
+class ProcessResult:
+    returncode: int
+    stdout: bytes
+    stderr: bytes
+    wall_time_ns: int
+    timed_out: bool
+    stopped: bool = False  # on_stdoutの要求で途中で打ち切った
+    user_time: Optional[float] = None  # 秒
+    sys_time: Optional[float] = None  # 秒
+    max_rss: Optional[int] = None  # KiB
+
+
+def _read_all(stream: IO[bytes], chunks: List[bytes]) -> None:
+    for chunk in iter(lambda: stream.read(65536), b''):
+        chunks.append(chunk)
+    stream.close()
+
+
+def _read_stream(
+    stream: IO[bytes], sink: Callable[[bytes], bool], on_stop: Callable[[], None]
+) -> None:
+    # read1は届いた分だけ返すので, 出力を溜め込まずに逐次渡せる
+    for chunk in iter(lambda: stream.read1(65536), b''):  # type: ignore
+        if not sink(chunk):
+            on_stop()
+            break
+    stream.close()
+
+
+def _write_all(stream: IO[bytes], data: bytes) -> None:
+    try:
+        stream.write(data)
+    except BrokenPipeError:
+        pass
+    finally:
+        try:
+            stream.close()
+        except BrokenPipeError:
+            pass
+
+
+class PipeIO:
+    """子プロセスの標準入出力を別スレッドで読み書きする."""
+
+    def __init__(
+        self,
+        stdin: IO[bytes],
+        stdout: IO[bytes],
+        stderr: IO[bytes],
+        input: bytes,
+        on_stdout: Optional[Callable[[bytes], bool]],
+        kill: Callable[[], None],
+    ) -> None:
+        self.stdout_chunks: List[bytes] = []
+        self.stderr_chunks: List[bytes] = []
+        self.stopped = threading.Event()
+
+        def stop() -> None:
+            self.stopped.set()
+            kill()
+
+        stdout_reader = (
+            threading.Thread(
+                target=_read_stream, args=(stdout, on_stdout, stop), daemon=True
+            )
+            if on_stdout
+            else threading.Thread(
+                target=_read_all, args=(stdout, self.stdout_chunks), daemon=True
+            )
+        )
+        self.threads = [
+            threading.Thread(target=_write_all, args=(stdin, input), daemon=True),
+            stdout_reader,
+            threading.Thread(
+                target=_read_all, args=(stderr, self.stderr_chunks), daemon=True
+            ),
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def join(self) -> None:
+        for thread in self.threads:
+            thread.join()
+
+
+class Cancellation:
+    """実行中のプロセスをまとめて打ち切る.
+
+    run_process などに渡すと, 実行中はプロセスを殺す関数が登録される. cancel() は登録された
+    すべてを呼び, それ以降に始まる実行も起動した直後に打ち切る.
+    """
+
+    def __init__(self) -> None:
+        self.event = threading.Event()
+        self.lock = threading.Lock()
+        self.kills: Set[Callable[[], None]] = set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self.event.is_set()
+
+    def cancel(self) -> None:
+        with self.lock:
+            self.event.set()
+            kills = list(self.kills)
+        for kill in kills:
+            kill()
+
+    @contextmanager
+    def watch(self, kill: Callable[[], None]) -> Iterator[None]:
+        with self.lock:
+            self.kills.add(kill)
+            cancelled = self.event.is_set()
+        if cancelled:
+            kill()
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.kills.discard(kill)
+
+
+def watch_cancel(
+    cancel: Optional[Cancellation], kill: Callable[[], None]
+) -> ContextManager[None]:
+    return cancel.watch(kill) if cancel else nullcontext()
+
+
+def kill_process_group(proc: subprocess.Popen, sig: int = signal.SIGKILL) -> None:
+    try:
+        os.killpg(proc.pid, sig)
+    except (ProcessLookupError, PermissionError, AttributeError):
+        try:
+            proc.send_signal(sig)
+        except ProcessLookupError:
+            pass
+
+
+def run_process(
+    cmd: List[str],
+    input: bytes,
+    timeout: Optional[float] = None,
+    address_space_limit: Optional[int] = None,
+    on_stdout: Optional[Callable[[bytes], bool]] = None,
+    measure: bool = True,
+    cancel: Optional[Cancellation] = None,
+) -> ProcessResult:
+    """子プロセスを実行し, 実行時間, CPU時間, 最大RSSを計測する.
+
+    計測はmeasure.pyを介したwait4で行う. address_space_limit (MiB) を指定すると,
+    RLIMIT_ASで仮想メモリの上限を設定する. on_stdoutを指定すると標準出力は保持せずに
+    逐次渡し, Falseが返ればその時点でプロセスを終了させる. measure=Falseなら計測用の
+    ラッパーを挟まずに直接起動する (実行時間は起動のオーバーヘッドを含む).
+    cancelを渡すと, それが打ち切られたときにプロセスグループごと終了させる.
+    """
+    report_fd = None
+    if CAN_MEASURE and measure:
+        report_fd, write_fd = os.pipe()
+        limit = (address_space_limit or 0) * 1024 * 1024
+        argv = [
+            sys.executable,
+            '-S',
+            '-E',
+            measure_wrapper.__file__,
+            str(write_fd),
+            str(limit),
+            *cmd,
+        ]
+        pass_fds: tuple = (write_fd,)
+    else:
+        argv, pass_fds = cmd, ()
+
+    start = time.perf_counter_ns()
+    proc = subprocess.Popen(
+        argv,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        start_new_session=True,
+        pass_fds=pass_fds,
+    )
+    if report_fd is not None:
+        os.close(write_fd)
+
+    assert proc.stdin and proc.stdout and proc.stderr
+    # 出力の途中で打ち切るときは, 計測中ならSIGTERMで解答だけを終了させて
+    # それまでのCPU時間と最大RSSをラッパーに報告させる
+    stop_signal = signal.SIGTERM if report_fd is not None else signal.SIGKILL
+    io = PipeIO(
+        proc.stdin,
+        proc.stdout,
+        proc.stderr,
+        input,
+        on_stdout,
+        lambda: kill_process_group(proc, stop_signal),
+    )
+
+    # Popen.wait(timeout)はポーリングで待つので, タイマーで打ち切ってブロッキングで待つ
+    timed_out = threading.Event()
+
+    def on_timeout() -> None:
+        timed_out.set()
+        kill_process_group(proc)
+
+    timer = threading.Timer(timeout, on_timeout) if timeout else None
+    if timer:
+        timer.start()
+    with watch_cancel(cancel, lambda: kill_process_group(proc)):
+        proc.wait()
+    wall_time_ns = time.perf_counter_ns() - start
+    if timer:
+        timer.cancel()
+
+    # 孫プロセスがパイプを掴んだままにならないようにプロセスグループごと片付ける
+    kill_process_group(proc)
+    proc.wait()
+    io.join()
+
+    result = ProcessResult(
+        returncode=proc.returncode,
+        stdout=b''.join(io.stdout_chunks),
+        stderr=b''.join(io.stderr_chunks),
+        wall_time_ns=wall_time_ns,
+        timed_out=timed_out.is_set(),
+        stopped=io.stopped.is_set(),
+    )
+    if report_fd is not None:
+        with os.fdopen(report_fd, 'r') as report:
+            if not result.timed_out:
+                _apply_report(result, report.read())
+    return result
+
+
+def _apply_report(result: ProcessResult, report: str) -> None:
+    # measure.py, forkserver.pyが書き出す `wall_ns status utime stime maxrss` を反映する
+    fields = report.split()
+    if len(fields) != 5:
+        return
+    result.wall_time_ns = int(fields[0])
+    result.returncode = os.waitstatus_to_exitcode(int(fields[1]))
+    result.user_time = float(fields[2])
+    result.sys_time = float(fields[3])
+    result.max_rss = int(fields[4])
+
+
+class ForkServer:
+    """Pythonの解答をimport済みのインタープリターからforkして実行する.
+
+    インタープリターの起動とpreloadするモジュールのimportを1度だけ行う. その時間は
+    startup_time_nsに記録するので, 起動込みの実行時間を見積もれる.
+    """
+
+    def __init__(self, python: str, source: str, modules: List[str]) -> None:
+        self.python = python
+        self.source = source
+        self.modules = modules
+        self.startup_time_ns = 0
+        self.failed_modules: List[str] = []
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def available(python: str = sys.executable) -> bool:
+        """このPythonとpythonの両方がfork serverを使えるか."""
+        return (
+            CAN_MEASURE and hasattr(socket, 'send_fds') and _can_run_forkserver(python)
+        )
+
+    def start(self) -> None:
+        """サーバーを起動する. 起動できなければRuntimeErrorを送出する."""
+        self.control, theirs = socket.socketpair()
+        start = time.perf_counter_ns()
+        try:
+            self.proc = subprocess.Popen(
+                [
+                    self.python,
+                    '-E',
+                    forkserver.__file__,
+                    str(theirs.fileno()),
+                    self.source,
+                    ','.join(self.modules),
+                ],
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                pass_fds=(theirs.fileno(),),
+            )
+        except OSError as e:
+            self.control.close()
+            raise RuntimeError('fork serverの起動に失敗しました') from e
+        finally:
+            theirs.close()
+        ready = _recv_line(self.control).split()
+        self.startup_time_ns = time.perf_counter_ns() - start
+        if not ready or ready[0] != 'ready':
+            self.close()
+            raise RuntimeError('fork serverの起動に失敗しました')
+        self.failed_modules = ready[1:]
+
+    def close(self) -> None:
+        self.control.close()
+        try:
+            self.proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+            self.proc.wait()
+
+    def __enter__(self) -> 'ForkServer':
+        self.start()
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    def run(
+        self,
+        input: bytes,
+        timeout: Optional[float] = None,
+        address_space_limit: Optional[int] = None,
+        on_stdout: Optional[Callable[[bytes], bool]] = None,
+        args: Sequence[str] = (),
+        cancel: Optional[Cancellation] = None,
+    ) -> ProcessResult:
+        stdin_r, stdin_w = os.pipe()
+        stdout_r, stdout_w = os.pipe()
+        stderr_r, stderr_w = os.pipe()
+        reply, theirs = socket.socketpair()
+        limit = (address_space_limit or 0) * 1024 * 1024
+
+        start = time.perf_counter_ns()
+        try:
+            with self.lock:
+                socket.send_fds(
+                    self.control,
+                    ['\0'.join([str(limit), *args]).encode()],
+                    [theirs.fileno(), stdin_r, stdout_w, stderr_w],
+                )
+        except OSError:
+            pass  # サーバーが終了している. 下でpidを受け取れずに失敗する
+        for fd in (theirs.fileno(), stdin_r, stdout_w, stderr_w):
+            os.close(fd)
+        theirs.detach()
+
+        line = _recv_line(reply)
+        if not line.strip().isdigit():
+            reply.close()
+            for fd in (stdin_w, stdout_r, stderr_r):
+                os.close(fd)
+            raise RuntimeError('fork serverが応答しませんでした')
+        pid = int(line)
+
+        def kill() -> None:
+            for killer in (os.killpg, os.kill):
+                try:
+                    killer(pid, signal.SIGKILL)
+                    return
+                except (ProcessLookupError, PermissionError):
+                    continue
+
+        io = PipeIO(
+            os.fdopen(stdin_w, 'wb'),
+            os.fdopen(stdout_r, 'rb'),
+            os.fdopen(stderr_r, 'rb'),
+            input,
+            on_stdout,
+            kill,
+        )
+
+        with watch_cancel(cancel, kill):
+            timed_out = not select.select([reply], [], [], timeout)[0]
+        if timed_out:
+            kill()
+        report = _recv_line(reply)
+        wall_time_ns = time.perf_counter_ns() - start
+        reply.close()
+        io.join()
+
+        result = ProcessResult(
+            returncode=-signal.SIGKILL,
+            stdout=b''.join(io.stdout_chunks),
+            stderr=b''.join(io.stderr_chunks),
+            wall_time_ns=wall_time_ns,
+            timed_out=timed_out,
+            stopped=io.stopped.is_set(),
+        )
+        if not timed_out:
+            _apply_report(result, report)
+        return result
+
+
+@functools.lru_cache(maxsize=None)
+def _can_run_forkserver(python: str) -> bool:
+    # atcdr.jsonで別のインタープリター(pypy3など)が指定されていることがあるので,
+    # 実際に解答を実行するものがforkserver.pyの使う機能を持っているかを確かめる
+    try:
+        return (
+            subprocess.run(
+                [python, '-E', '-c', FORKSERVER_PROBE],
+                stdin=subprocess.DEVNULL,
+                capture_output=True,
+                timeout=FORKSERVER_PROBE_TIMEOUT,
+            ).returncode
+            == 0
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return False
+
+
+def _recv_line(sock: socket.socket) -> str:
+    # 後続の行を読み込みすぎないよう, 改行までを覗き見てからその分だけ受け取る
+    data = b''
+    while not data.endswith(b'\n'):
+        peeked = sock.recv(4096, socket.MSG_PEEK)
+        if not peeked:
+            break
+        end = peeked.find(b'\n')
+        data += sock.recv(end + 1 if end >= 0 else len(peeked))
+    return data.decode()
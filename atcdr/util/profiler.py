@@ -0,0 +1,108 @@
+import os
+import pstats
+import re
+import shutil
+import subprocess
+import tempfile
+from abc import ABC, abstractmethod
+from typing import List, NamedTuple, Optional
+
+from atcdr.util.filetype import Lang
+
+PROFILE_DIR = os.path.join(tempfile.gettempdir(), 'atcdr', 'profile')
+PERF_REPORT_LINE = re.compile(r'^\s*([\d.]+)%\s+(?:\[[.k]\]\s+)?(.+?)\s*$')
+
+
+class Hotspot(NamedTuple):
+    name: str
+    percent: float  # 関数自身にかかった時間の割合
+    self_time: Optional[float] = None  # ms
+    calls: Optional[int] = None
+
+
+class ProfileReport(NamedTuple):
+    path: str
+    hotspots: List[Hotspot]
+
+
+class Profiler(ABC):
+    """実行コマンドをプロファイラーで包み, 結果から時間のかかった関数を取り出す."""
+
+    suffix = '.prof'
+
+    def __init__(self, label: str) -> None:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        fd, self.path = tempfile.mkstemp(
+            prefix=f'{re.sub(r"[^0-9A-Za-z_-]", "_", label)}-',
+            suffix=self.suffix,
+            dir=PROFILE_DIR,
+        )
+        os.close(fd)
+
+    @abstractmethod
+    def wrap(self, cmd: List[str]) -> List[str]: ...
+
+    def collected(self) -> bool:
+        """プロファイラーが結果を書き出したか. 途中で終了させられると空のまま残る."""
+        try:
+            return os.path.getsize(self.path) > 0
+        except OSError:
+            return False
+
+    @abstractmethod
+    def hotspots(self, top: int) -> List[Hotspot]: ...
+
+
+class CProfileProfiler(Profiler):
+    def wrap(self, cmd: List[str]) -> List[str]:
+        # python3 source.py -> python3 -m cProfile -o PATH source.py
+        return [cmd[0], '-m', 'cProfile', '-o', self.path, *cmd[1:]]
+
+    def hotspots(self, top: int) -> List[Hotspot]:
+        stats = pstats.Stats(self.path).stats  # type: ignore
+        total = sum(tt for _, _, tt, _, _ in stats.values()) or 1.0
+        entries = sorted(stats.items(), key=lambda item: item[1][2], reverse=True)
+        result = []
+        for (file, line, func), (_, calls, tt, _, _) in entries[:top]:
+            name = func if file == '~' else f'{os.path.basename(file)}:{line}({func})'
+            result.append(Hotspot(name, tt / total * 100, tt * 1000, calls))
+        return result
+
+
+class PerfProfiler(Profiler):
+    suffix = '.perf.data'
+
+    def wrap(self, cmd: List[str]) -> List[str]:
+        return ['perf', 'record', '-q', '-o', self.path, '--', *cmd]
+
+    def hotspots(self, top: int) -> List[Hotspot]:
+        report = subprocess.run(
+            [
+                'perf',
+                'report',
+                '-i',
+                self.path,
+                '--stdio',
+                '--no-children',
+                '--sort',
+                'symbol',
+                '-q',
+            ],
+            capture_output=True,
+            text=True,
+        )
+        result = []
+        for line in report.stdout.splitlines():
+            m = PERF_REPORT_LINE.match(line)
+            if m:
+                result.append(Hotspot(m.group(2), float(m.group(1))))
+        return result[:top]
+
+
+def create_profiler(lang: Lang, label: str) -> Optional[Profiler]:
+    """言語に合ったプロファイラーを返す. 使えるものがなければNone."""
+    if lang == Lang.PYTHON:
+        return CProfileProfiler(label)
+    if lang in (Lang.C, Lang.CPP, Lang.RUST) and shutil.which('perf'):
+        return PerfProfiler(label)
+    return None
@@ -0,0 +1,31 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """複数のスレッドで共有するトークンバケット方式のレート制限.
+
+    トークンは毎秒rate個ずつ最大capacity個まで溜まり, リクエストごとに1個使う.
+    足りないときは予約だけして, ロックの外で順番が来るまで待つ.
+    """
+
+    def __init__(self, rate: float, capacity: int = 1) -> None:
+        if rate <= 0:
+            raise ValueError('rateは正の数で指定してください')
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
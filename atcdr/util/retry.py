@@ -0,0 +1,109 @@
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, NamedTuple, Optional
+
+
+class RetryRule(NamedTuple):
+    retry: bool
+    shared: bool = False  # Trueなら全スレッドをまとめて待たせる
+    message: str = ''
+
+
+# ステータスコードごとの扱い. ここにないものは百の位で決める
+STATUS_RULES: Dict[int, RetryRule] = {
+    408: RetryRule(True, message='タイムアウトしました'),
+    429: RetryRule(True, shared=True, message='リクエストが多すぎます'),
+    500: RetryRule(True, message='サーバーエラーが発生しました'),
+    502: RetryRule(True, message='サーバーエラーが発生しました'),
+    503: RetryRule(True, shared=True, message='サーバーが混み合っています'),
+    504: RetryRule(True, message='サーバーエラーが発生しました'),
+}
+CLASS_RULES: Dict[int, RetryRule] = {
+    3: RetryRule(False, message='リダイレクトが解決できませんでした'),
+    4: RetryRule(False, message='問題が見つかりません'),
+    5: RetryRule(False, message='サーバーエラーが発生しました'),
+}
+# 接続エラーやタイムアウトなど, レスポンスが得られなかったとき
+CONNECTION_ERROR_RULE = RetryRule(True, message='接続に失敗しました')
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-Afterヘッダーの秒数かHTTP日付を, 待つ秒数にする."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+class RetryPolicy:
+    """再試行するかどうかと, 次の試行までの待ち時間を決める.
+
+    待ち時間は base_delay * 2^(試行回数) を上限 max_delay で抑え, 0からその値までの
+    一様乱数にする (full jitter). Retry-Afterがあればそれより短くはしない.
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = 5,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+        rules: Optional[Dict[int, RetryRule]] = None,
+    ) -> None:
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.rules = {**STATUS_RULES, **(rules or {})}
+
+    def rule(self, status_code: int) -> RetryRule:
+        if status_code in self.rules:
+            return self.rules[status_code]
+        return CLASS_RULES.get(status_code // 100, RetryRule(False))
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        backoff = min(self.max_delay, self.base_delay * 2**attempt)
+        delay = random.uniform(0, backoff)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+
+class SharedBackoff:
+    """スレッド間で共有する待ち状態.
+
+    どれか1つのリクエストが429などを受けたら, その待ち時間が過ぎるまで
+    すべてのスレッドが次のリクエストを送らない. 続けて受けるほど待ち時間が延びる.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.blocked_until = 0.0
+        self.level = 0  # 続けて429などを受けた回数
+
+    def wait(self) -> None:
+        while True:
+            with self.lock:
+                remaining = self.blocked_until - time.monotonic()
+            if remaining <= 0:
+                return
+            time.sleep(remaining)
+
+    def pause(self, policy: RetryPolicy, retry_after: Optional[float]) -> float:
+        with self.lock:
+            delay = policy.delay(self.level, retry_after)
+            # 待っている間に他のスレッドが受けた分は, 同じ1回として数える
+            if time.monotonic() >= self.blocked_until:
+                self.level += 1
+            self.blocked_until = max(self.blocked_until, time.monotonic() + delay)
+            return self.blocked_until - time.monotonic()
+
+    def succeeded(self) -> None:
+        with self.lock:
+            self.level = 0
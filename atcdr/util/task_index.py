@@ -0,0 +1,60 @@
+import json
+import os
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+
+TASK_INDEX = os.path.join(os.path.expanduser('~'), '.cache', 'atcder', 'tasks.json')
+# 終わったコンテストの問題一覧は変わらないので長く使い, 開催中や終了時刻の
+# わからないコンテストは問題の追加や公開に追いつけるように短くする
+PAST_CONTEST_TTL = 30 * 24 * 60 * 60
+RUNNING_CONTEST_TTL = 5 * 60
+
+
+class TaskIndex:
+    """コンテストの問題一覧 (ラベルとURL) をコンテストのURLごとに保存する.
+
+    一覧と一緒に取得した時刻とコンテストの終了時刻を記録し, 終了後に取得したものは
+    PAST_CONTEST_TTL, それ以外はRUNNING_CONTEST_TTLの間だけ使う.
+    """
+
+    def __init__(self, path: str = TASK_INDEX) -> None:
+        self.path = path
+
+    def _read(self) -> Dict[str, dict]:
+        try:
+            with open(self.path, 'r') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def load(
+        self, url: str, allow_expired: bool = False
+    ) -> Optional[List[Tuple[str, str]]]:
+        """保存した一覧. allow_expiredなら, 期限が切れていても返す."""
+        entry = self._read().get(url)
+        if not isinstance(entry, dict):
+            return None
+        end_time = entry.get('end_time')
+        fetched_at = entry.get('fetched_at', 0)
+        finished = end_time is not None and fetched_at >= end_time
+        ttl = PAST_CONTEST_TTL if finished else RUNNING_CONTEST_TTL
+        if not allow_expired and time.time() - fetched_at >= ttl:
+            return None
+        return [(label, task_url) for label, task_url in entry['tasks']]
+
+    def store(
+        self, url: str, tasks: List[Tuple[str, str]], end_time: Optional[float]
+    ) -> None:
+        index = self._read()
+        index[url] = {'tasks': tasks, 'end_time': end_time, 'fetched_at': time.time()}
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(
+                dir=os.path.dirname(self.path), suffix='.tmp'
+            )
+            with os.fdopen(fd, 'w') as file:
+                json.dump(index, file, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass
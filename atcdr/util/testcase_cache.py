@@ -0,0 +1,187 @@
+import hashlib
+import itertools
+import json
+import os
+import tempfile
+from typing import List, NamedTuple, Optional
+
+# 問題のHTMLから取り出したサンプルケースを書き出すディレクトリー.
+# 手作りのケース (xxx.in と xxx.out の組) を置くとサンプルと一緒にテストされる
+TESTCASE_DIR = 'tests'
+INDEX_FILE = 'index.json'
+
+
+class ProblemLimits(NamedTuple):
+    time_limit: Optional[int]  # ms
+    memory_limit: Optional[int]  # MiB
+
+
+class CachedProblem(NamedTuple):
+    lcases: List  # List[LabeledTestCase]
+    limits: ProblemLimits
+    url: str
+
+
+class TestCaseCache:
+    """問題のHTMLを解析した結果をテストケースのファイルとして保存する.
+
+    index.jsonにはHTMLのハッシュと更新時刻, サンプルのファイル名, 制限, URLを記録する.
+    HTMLが変わっていなければ, BeautifulSoupを読み込まずにファイルからケースを読み込む.
+    """
+
+    def __init__(self, html_path: str, directory: Optional[str] = None) -> None:
+        self.html_path = html_path
+        self.directory = directory or os.path.join(
+            os.path.dirname(html_path), TESTCASE_DIR
+        )
+        self.index_path = os.path.join(self.directory, INDEX_FILE)
+
+    def _html_hash(self) -> str:
+        with open(self.html_path, 'rb') as file:
+            return hashlib.sha256(file.read()).hexdigest()
+
+    def _load_index(self) -> Optional[dict]:
+        try:
+            with open(self.index_path, 'r') as file:
+                index = json.load(file)
+        except (OSError, ValueError):
+            return None
+
+        st = os.stat(self.html_path)
+        if index.get('html') != os.path.basename(self.html_path):
+            return None
+        if index.get('mtime_ns') == st.st_mtime_ns and index.get('size') == st.st_size:
+            return index
+        # 更新時刻だけが変わった場合は中身を比べ, 同じなら記録を更新して使う
+        if index.get('sha256') != self._html_hash():
+            return None
+        index['mtime_ns'], index['size'] = st.st_mtime_ns, st.st_size
+        self._write_index(index)
+        return index
+
+    def _write_index(self, index: dict) -> None:
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as file:
+            json.dump(index, file, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.index_path)
+
+    def _read(self, name: str) -> str:
+        with open(os.path.join(self.directory, name), 'r') as file:
+            return file.read()
+
+    def store(self) -> dict:
+        # bs4の読み込みは遅いので, キャッシュが使えないときだけ読み込む
+        from atcdr.util.parse import ProblemHTML
+
+        # _load_index と比べられるように, ハッシュは生のバイト列から求める
+        sha256 = self._html_hash()
+        with open(self.html_path, 'r') as file:
+            html = file.read()
+        problem = ProblemHTML(html)
+        lcases = problem.load_labeled_testcase()
+        limits = problem.load_limits()
+
+        os.makedirs(self.directory, exist_ok=True)
+        # 前回書き出したサンプルは消す. 残すとサンプルが減ったときに手作りのケースとして読まれる
+        for name in self._previous_samples():
+            for suffix in ('.in', '.out'):
+                try:
+                    os.remove(os.path.join(self.directory, name + suffix))
+                except OSError:
+                    pass
+        samples = []
+        for i, lcase in enumerate(lcases, start=1):
+            name = self._free_name(i)
+            for suffix, text in (
+                ('.in', lcase.case.input),
+                ('.out', lcase.case.output),
+            ):
+                with open(os.path.join(self.directory, name + suffix), 'w') as file:
+                    file.write(text)
+            samples.append({'label': lcase.label, 'name': name})
+
+        st = os.stat(self.html_path)
+        index = {
+            'html': os.path.basename(self.html_path),
+            'sha256': sha256,
+            'mtime_ns': st.st_mtime_ns,
+            'size': st.st_size,
+            'url': problem.link,
+            'time_limit': limits.time_limit,
+            'memory_limit': limits.memory_limit,
+            'samples': samples,
+        }
+        self._write_index(index)
+        return index
+
+    def _free_name(self, i: int) -> str:
+        # 前回のサンプルは消してあるので, 残っているファイルは手作りのケース.
+        # 同じ名前があれば上書きせずに, 空いている別の名前にする
+        candidates = itertools.chain(
+            [f'{i:02}', f'sample{i:02}'],
+            (f'sample{i:02}-{n}' for n in itertools.count(2)),
+        )
+        return next(
+            name
+            for name in candidates
+            if not any(
+                os.path.exists(os.path.join(self.directory, name + suffix))
+                for suffix in ('.in', '.out')
+            )
+        )
+
+    def _previous_samples(self) -> List[str]:
+        try:
+            with open(self.index_path, 'r') as file:
+                return [sample['name'] for sample in json.load(file)['samples']]
+        except (OSError, ValueError, KeyError, TypeError):
+            return []
+
+    def handmade_names(self, samples: List[str]) -> List[str]:
+        names = []
+        for file in sorted(os.listdir(self.directory)):
+            name, ext = os.path.splitext(file)
+            if (
+                ext == '.in'
+                and name not in samples
+                and os.path.isfile(os.path.join(self.directory, name + '.out'))
+            ):
+                names.append(name)
+        return names
+
+    def _from_index(self, index: dict) -> CachedProblem:
+        from atcdr.test import LabeledTestCase, TestCase
+
+        def case(name: str) -> TestCase:
+            # 全文を表示するときは, 一時ファイルに書き出さずにこのファイルを示す
+            return TestCase(
+                self._read(name + '.in'),
+                self._read(name + '.out'),
+                input_path=os.path.join(self.directory, name + '.in'),
+                output_path=os.path.join(self.directory, name + '.out'),
+            )
+
+        samples = [sample['name'] for sample in index['samples']]
+        lcases = [
+            LabeledTestCase(sample['label'], case(sample['name']))
+            for sample in index['samples']
+        ]
+        lcases += [
+            LabeledTestCase(name, case(name)) for name in self.handmade_names(samples)
+        ]
+        limits = ProblemLimits(index['time_limit'], index['memory_limit'])
+        return CachedProblem(lcases, limits, index['url'])
+
+    def load(self) -> CachedProblem:
+        index = self._load_index()
+        if index is not None:
+            try:
+                return self._from_index(index)
+            except OSError:
+                pass  # サンプルのファイルが消されていたら作り直す
+        return self._from_index(self.store())
+
+
+def find_problem_html(directory: str = '.') -> Optional[str]:
+    html_paths = sorted(f for f in os.listdir(directory) if f.endswith('.html'))
+    return os.path.join(directory, html_paths[0]) if html_paths else None
@@ -0,0 +1,115 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+from abc import ABC, abstractmethod
+from typing import Optional, Tuple
+
+# <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+INOTIFY_EVENT = struct.Struct('iIII')
+
+# 1回の保存で複数のイベントが届くので, この時間イベントが途切れるまで待ってまとめる
+SETTLE_TIME = 0.02  # 秒
+POLLING_INTERVAL = 0.05  # 秒
+
+
+class FileWatcher(ABC):
+    """ファイルが保存されるまで待つ."""
+
+    def __init__(self, path: str) -> None:
+        self.path = os.path.abspath(path)
+
+    @abstractmethod
+    def wait(self) -> None: ...
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self) -> 'FileWatcher':
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+
+class InotifyWatcher(FileWatcher):
+    """inotifyでファイルのあるディレクトリーを監視する.
+
+    エディターは一時ファイルに書いてからリネームして保存することがあるので,
+    ファイルそのものではなくディレクトリーを監視し, 名前で絞り込む.
+    """
+
+    def __init__(self, path: str) -> None:
+        super().__init__(path)
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1に失敗しました')
+        mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+        directory, self.name = os.path.split(self.path)
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, 'inotify_add_watchに失敗しました')
+
+    def _read_events(self, timeout: Optional[float]) -> Tuple[bool, bool]:
+        # (イベントが届いたか, 監視対象のファイルのイベントだったか)
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return False, False
+        data = os.read(self.fd, 65536)
+        matched = False
+        pos = 0
+        while pos < len(data):
+            _, _, _, length = INOTIFY_EVENT.unpack_from(data, pos)
+            pos += INOTIFY_EVENT.size
+            name = data[pos : pos + length].rstrip(b'\0')
+            pos += length
+            matched = matched or os.fsdecode(name) == self.name
+        return True, matched
+
+    def wait(self) -> None:
+        while not self._read_events(None)[1]:
+            pass
+        while self._read_events(SETTLE_TIME)[0]:
+            pass
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class PollingWatcher(FileWatcher):
+    """inotifyが使えない環境向けに, 一定間隔でstatを比べる."""
+
+    def __init__(self, path: str) -> None:
+        super().__init__(path)
+        self.last = self._stat()
+
+    def _stat(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size, st.st_ino
+
+    def wait(self) -> None:
+        while True:
+            time.sleep(POLLING_INTERVAL)
+            current = self._stat()
+            if current is not None and current != self.last:
+                self.last = current
+                return
+
+
+def create_watcher(path: str) -> FileWatcher:
+    if sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(path)
+        except (OSError, AttributeError):
+            pass
+    return PollingWatcher(path)